@@ -14,8 +14,12 @@ from sqlparse import engine
 from sqlparse import tokens
 from sqlparse import filters
 from sqlparse import formatter
+from sqlparse import lexer
 
-from sqlparse.compat import text_type
+from sqlparse.compat import text_type, u
+from sqlparse.engine import parallel
+from sqlparse.formatter import Formatter
+from sqlparse.utils import mapped_file
 
 __version__ = '0.2.0.dev0'
 __all__ = ['engine', 'filters', 'formatter', 'sql', 'tokens', 'cli']
@@ -26,6 +30,12 @@ def parse(sql, encoding=None, **options):
 
     :param sql: A string containing one or more SQL statements.
     :param encoding: The encoding of the statement (optional).
+    :param grouping: The name of a grouping profile (``'full'``,
+                     ``'identifiers'``, ``'parenthesis'`` or ``'none'``) or
+                     a set of functions from :mod:`sqlparse.engine.grouping`
+                     to group the tokens with (optional, default: all).
+    :param lazy: If ``True`` the tokens of a group are grouped when they
+                 are first accessed (optional, default: ``False``).
     :returns: A tuple of :class:`~sqlparse.sql.Statement` instances.
     """
     return tuple(parsestream(sql, encoding, **options))
@@ -36,15 +46,34 @@ def parsestream(stream, encoding=None, **options):
 
     :param stream: A file-like object.
     :param encoding: The encoding of the stream contents (optional).
+        A binary stream is decoded as UTF-8 by default, undecodable
+        bytes are replaced with U+FFFD.
+    :param grouping: Selects the grouping functions, see :func:`parse`.
+    :param lazy: Enables lazy grouping, see :func:`parse`.
     :returns: A generator of :class:`~sqlparse.sql.Statement` instances.
     """
     stack = engine.FilterStack()
-    stack.enable_grouping()
     options = formatter.validate_options(options)
+    stack.enable_grouping(options['grouping'], options.get('lazy', False))
     stack = formatter.build_filter_stack(stack, options)
     return stack.run(stream, encoding)
 
 
+def parsestream_file(path, encoding=None, **options):
+    """Parses sql statements from the file at *path*.
+
+    The file is memory-mapped and tokenized in chunks, its contents are
+    never read into a single string.
+
+    :param path: Path of the file.
+    :param encoding: The encoding of the file contents (default: utf-8).
+    :returns: A generator of :class:`~sqlparse.sql.Statement` instances.
+    """
+    with mapped_file(path) as stream:
+        for stmt in parsestream(stream, encoding, **options):
+            yield stmt
+
+
 def format(sql, encoding=None, **options):
     """Format *sql* according to *options*.
 
@@ -53,13 +82,26 @@ def format(sql, encoding=None, **options):
     In addition to the formatting options this function accepts the
     keyword "encoding" which determines the encoding of the statement.
 
+    Use a :class:`~sqlparse.Formatter` to format many statements with the
+    same options.
+
     :returns: The formatted SQL statement as string.
     """
-    stack = engine.FilterStack()
-    options = formatter.validate_options(options)
-    stack = formatter.build_filter_stack(stack, options)
-    stack.postprocess.append(filters.SerializerUnicode())
-    return ''.join(stack.run(sql, encoding))
+    return Formatter(**options).format(sql, encoding)
+
+
+def format_to(fileobj, sql, encoding=None, **options):
+    """Format *sql* according to *options* and write it to *fileobj*.
+
+    Like :func:`format` but the statements are written to the text file
+    *fileobj* one after another. If *sql* is a file-like object only a
+    single statement is kept in memory at a time.
+
+    :param fileobj: A file-like object opened for writing text.
+    :param sql: A string or a file-like object with the SQL statements.
+    :param encoding: The encoding of the statements (optional).
+    """
+    Formatter(**options).format_to(fileobj, sql, encoding)
 
 
 def split(sql, encoding=None):
@@ -69,5 +111,40 @@ def split(sql, encoding=None):
     :param encoding: The encoding of the statement (optional).
     :returns: A list of strings.
     """
+    if hasattr(sql, 'read'):
+        sql = sql.read()
+    sql = u(sql, encoding)
+    stream = lexer.tokenize(sql)
+    offsets = engine.StatementSplitter().process_offsets(stream)
+    return [sql[start:end].strip() for start, end in offsets]
+
+
+def split_file(path, encoding=None):
+    """Split the SQL statements in the file at *path*.
+
+    Like :func:`split` but the file is memory-mapped and statements are
+    generated one after another.
+
+    :param path: Path of the file.
+    :param encoding: The encoding of the file contents (default: utf-8).
+    :returns: A generator of strings.
+    """
     stack = engine.FilterStack()
-    return [text_type(stmt).strip() for stmt in stack.run(sql, encoding)]
+    with mapped_file(path) as stream:
+        for stmt in stack.run(stream, encoding):
+            yield text_type(stmt).strip()
+
+
+def split_parallel(path, encoding=None, processes=None):
+    """Split the SQL statements in the file at *path* using several processes.
+
+    The file is cut into ranges at statement boundaries which are split
+    by a :mod:`multiprocessing` pool.
+
+    :param path: Path of the file.
+    :param encoding: The encoding of the file contents (default: utf-8).
+      Must be ASCII compatible.
+    :param processes: Number of worker processes (default: number of CPUs).
+    :returns: A generator of strings, in the order of the file.
+    """
+    return parallel.split_parallel(path, encoding, processes)
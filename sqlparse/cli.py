@@ -52,6 +52,21 @@ def create_parser():
         action='version',
         version=sqlparse.__version__)
 
+    parser.add_argument(
+        '--split',
+        dest='split',
+        action='store_true',
+        default=False,
+        help='only split FILE into statements, separated by an empty line')
+
+    parser.add_argument(
+        '-j', '--jobs',
+        dest='jobs',
+        metavar='N',
+        type=int,
+        help='number of processes used with --split '
+             '(defaults to the number of CPUs)')
+
     group = parser.add_argument_group('Formatting Options')
 
     group.add_argument(
@@ -133,6 +148,12 @@ def main(args=None):
 
     if args.filename == '-':  # read from stdin
         data = sys.stdin.read()
+    elif args.split:
+        # split_parallel maps the file, only check that it's readable
+        try:
+            open(args.filename).close()
+        except IOError as e:
+            return _error('Failed to read {0}: {1}'.format(args.filename, e))
     else:
         try:
             # TODO: Needs to deal with encoding
@@ -148,6 +169,20 @@ def main(args=None):
     else:
         stream = sys.stdout
 
+    if args.split:
+        if args.filename == '-':
+            stmts = sqlparse.split(data)
+        else:
+            stmts = sqlparse.split_parallel(args.filename,
+                                            processes=args.jobs)
+        for stmt in stmts:
+            s = stmt + '\n\n'
+            if PY2:
+                s = s.encode('utf-8', 'replace')
+            stream.write(s)
+        stream.flush()
+        return 0
+
     formatter_opts = vars(args)
     try:
         formatter_opts = sqlparse.formatter.validate_options(formatter_opts)
@@ -31,6 +31,7 @@ if PY3:
 
     text_type = str
     string_types = (str,)
+    unichr = chr
     from io import StringIO
 
 
@@ -51,4 +52,5 @@ elif PY2:
 
     text_type = unicode
     string_types = (str, unicode,)
+    unichr = unichr
     from StringIO import StringIO
@@ -18,14 +18,36 @@ class FilterStack(object):
         self.stmtprocess = []
         self.postprocess = []
         self._grouping = False
+        self._grouping_passes = None
+        self._grouping_lazy = False
 
-    def enable_grouping(self):
+    def enable_grouping(self, passes=None, lazy=False):
+        """Enables grouping of the statements.
+
+        *passes* is the set of grouping functions to apply, all of them
+        if it's ``None``. If *lazy* is ``True`` subgroups are grouped on
+        first access. Enabling it again without arguments selects eager
+        grouping with all functions, filters relying on grouping do so.
+        """
         self._grouping = True
+        self._grouping_passes = passes
+        self._grouping_lazy = lazy
 
     def run(self, sql, encoding=None):
+        """Yields the processed statements of *sql*.
+
+        Filters keeping state while they process the statements have a
+        ``context()`` method, the statements of each run are processed
+        by new contexts. The stack isn't changed by running it, it can
+        be run by several threads at once.
+        """
+        preprocess = [_context(filter_) for filter_ in self.preprocess]
+        stmtprocess = [_context(filter_) for filter_ in self.stmtprocess]
+        postprocess = [_context(filter_) for filter_ in self.postprocess]
+
         stream = lexer.tokenize(sql, encoding)
         # Process token stream
-        for filter_ in self.preprocess:
+        for filter_ in preprocess:
             stream = filter_.process(stream)
 
         stream = StatementSplitter().process(stream)
@@ -33,12 +55,19 @@ class FilterStack(object):
         # Output: Stream processed Statements
         for stmt in stream:
             if self._grouping:
-                stmt = grouping.group(stmt)
+                stmt = grouping.group(stmt, passes=self._grouping_passes,
+                                      lazy=self._grouping_lazy)
 
-            for filter_ in self.stmtprocess:
+            for filter_ in stmtprocess:
                 filter_.process(stmt)
 
-            for filter_ in self.postprocess:
+            for filter_ in postprocess:
                 stmt = filter_.process(stmt)
 
             yield stmt
+
+
+def _context(filter_):
+    """Returns a new context of *filter_* if it has one."""
+    context = getattr(filter_, 'context', None)
+    return filter_ if context is None else context()
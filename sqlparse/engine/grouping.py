@@ -5,77 +5,225 @@
 # This module is part of python-sqlparse and is released under
 # the BSD License: http://www.opensource.org/licenses/bsd-license.php
 
+from functools import partial
+
 from sqlparse import sql
 from sqlparse import tokens as T
-from sqlparse.utils import imt
+from sqlparse.compat import string_types
+from sqlparse.utils import Matcher
 
 T_NUMERICAL = (T.Number, T.Number.Integer, T.Number.Float)
 T_STRING = (T.String, T.String.Single, T.String.Symbol)
 T_NAME = (T.Name, T.Name.Placeholder)
 
-
-def _group_matching(tlist, cls):
-    """Groups Tokens that have beginning and end."""
+# Tokens matched by the grouping functions
+M_TYPECAST = Matcher(m=(T.Punctuation, '::'))
+M_PERIOD = Matcher(m=(T.Punctuation, '.'))
+M_PERIOD_PREV = Matcher(i=(sql.SquareBrackets, sql.Identifier),
+                        t=(T.Name, T.String.Symbol))
+M_PERIOD_NEXT = Matcher(i=(sql.SquareBrackets, sql.Function),
+                        t=(T.Name, T.String.Symbol, T.Wildcard))
+M_AS_NEXT = Matcher(t=(T.DML, T.DDL))
+M_ASSIGNMENT = Matcher(m=(T.Assignment, ':='))
+M_COMPARISON_SIDE = Matcher(i=(sql.Parenthesis, sql.Function, sql.Identifier,
+                               sql.Operation),
+                            t=T_NUMERICAL + T_STRING + T_NAME)
+M_IDENTIFIER = Matcher(t=(T.String.Symbol, T.Name))
+M_ARRAY_PREV = Matcher(i=(sql.SquareBrackets, sql.Identifier, sql.Function),
+                       t=(T.Name, T.String.Symbol))
+M_OPERATOR = Matcher(t=(T.Operator, T.Wildcard))
+M_OPERAND = Matcher(i=(sql.SquareBrackets, sql.Parenthesis, sql.Function,
+                       sql.Identifier, sql.Operation),
+                    t=T_NUMERICAL + T_STRING + T_NAME)
+M_COMMA = Matcher(m=(T.Punctuation, ','))
+M_LIST_ITEM = Matcher(i=(sql.Function, sql.Case, sql.Identifier,
+                         sql.Comparison, sql.IdentifierList, sql.Operation),
+                      m=(T.Keyword, ('null', 'role')),
+                      t=(T_NUMERICAL + T_STRING + T_NAME +
+                         (T.Keyword, T.Comment, T.Wildcard,
+                          T.Comment.Multiline)))
+M_ALIASED_PREV = Matcher(i=(sql.Parenthesis, sql.Function, sql.Case,
+                            sql.Identifier, sql.Operation),
+                         t=T.Number)
+M_FUNCTION_NAME = Matcher(t=T.Name)
+M_ORDER_PREV = Matcher(i=sql.Identifier, t=T.Number)
+
+
+# Groups that have beginning and end, in the order they are grouped.
+# A token closing more than one of them closes the first one and then,
+# inside of it, the others.
+MATCHING = (sql.SquareBrackets, sql.Parenthesis, sql.Case, sql.If,
+            sql.For, sql.Begin)
+
+
+def _matching_values():
+    """Maps normalized values to the classes a token may open or close."""
+    values = {}
+    for cls in MATCHING:
+        for _, match_values in (cls.M_OPEN, cls.M_CLOSE):
+            if isinstance(match_values, string_types):
+                match_values = (match_values,)
+            for value in match_values:
+                values.setdefault(value.upper(), set()).add(cls)
+    return values
+
+
+_MATCHING_VALUES = _matching_values()
+
+
+class _ClassMatchers(dict):
+    """Compiles the M_OPEN or M_CLOSE pattern of a class when first used.
+
+    Threads may compile the same pattern at once, one of the equal
+    matchers is kept.
+    """
+
+    def __init__(self, attr):
+        super(_ClassMatchers, self).__init__()
+        self.attr = attr
+
+    def __missing__(self, cls):
+        matcher = self[cls] = Matcher(m=getattr(cls, self.attr))
+        return matcher
+
+
+M_OPENS = _ClassMatchers('M_OPEN')
+M_CLOSES = _ClassMatchers('M_CLOSE')
+
+
+def group_matching(tlist, classes=MATCHING):
+    """Groups all tokens that have beginning and end in a single pass.
+
+    The result is the same as grouping each of the *classes* in turn,
+    *classes* has to keep the order of ``MATCHING``. Existing subgroups
+    are grouped too, except by their own class.
+    """
+    stack = [(tlist, classes)]
+    while stack:
+        tlist, classes = stack.pop()
+        stack.extend((token, tuple(cls for cls in classes
+                                   if not isinstance(token, cls)))
+                     for token in tlist.tokens if token.is_group)
+        if classes:
+            _group_pairs(tlist, _match_pairs(tlist.tokens, classes))
+
+
+def _match_pairs(tokens, classes):
+    """Returns the pairs of opening and closing tokens in *tokens*.
+
+    Opening tokens are tracked on a single stack. An unclosed token of a
+    class that comes first in *classes* separates the tokens above it
+    from the tokens below, but only if it's closed later on. The pass is
+    repeated if this turns out to be wrong, ignoring the unclosed tokens
+    of that class. This only happens on unbalanced input.
+    """
+    ignored = set()
+    while True:
+        pairs, blocked, opened = _match_pass(tokens, classes, ignored)
+        unclosed = [cls for idx, cls in blocked if idx not in pairs]
+        if not unclosed:
+            return pairs
+        cls = min(unclosed, key=classes.index)
+        ignored.update(idx for idx, other in opened
+                       if other is cls and idx not in pairs)
+
+
+def _match_pass(tokens, classes, ignored):
+    rank = dict((cls, pos) for pos, cls in enumerate(classes))
+    # Number of unclosed tokens of each class in opens
+    unclosed = dict.fromkeys(classes, 0)
     opens = []
-    tidx_offset = 0
-    for idx, token in enumerate(list(tlist)):
-        tidx = idx - tidx_offset
-
-        if token.is_whitespace:
-            # ~50% of tokens will be whitespace. Will checking early
-            # for them avoid 3 comparisons, but then add 1 more comparison
-            # for the other ~50% of tokens...
+    opened = []
+    blocked = set()
+    pairs = {}
+    for idx, token in enumerate(tokens):
+        if token.is_group:
             continue
-
-        if token.is_group and not isinstance(token, cls):
-            # Check inside previously grouped (ie. parenthesis) if group
-            # of differnt type is inside (ie, case). though ideally  should
-            # should check for all open/close tokens at once to avoid recursion
-            _group_matching(token, cls)
+        candidates = _MATCHING_VALUES.get(token.normalized)
+        if candidates is None:
             continue
 
-        if token.match(*cls.M_OPEN):
-            opens.append(tidx)
+        for cls in classes:
+            if cls in candidates and M_OPENS[cls](token):
+                if idx not in ignored:
+                    opens.append((idx, cls))
+                    opened.append((idx, cls))
+                    unclosed[cls] += 1
+                break
+        else:
+            # Closes the innermost unclosed token of the first class and
+            # then, inside of that group, the ones of the other classes.
+            first, low = len(opens), 0
+            for cls in classes:
+                if (not unclosed[cls] or cls not in candidates or
+                        not M_CLOSES[cls](token)):
+                    continue
+                pos = len(opens) - 1
+                while pos >= low and rank[opens[pos][1]] > rank[cls]:
+                    pos -= 1
+                if pos < low:
+                    continue
+                if opens[pos][1] is not cls:
+                    # separated from the unclosed tokens of cls
+                    blocked.add(opens[pos])
+                    continue
+                pairs[opens[pos][0]] = idx, cls
+                first = min(first, pos)
+                low = pos + 1
+            # Tokens inside of the new groups can't be closed anymore
+            for _, other in opens[first:]:
+                unclosed[other] -= 1
+            del opens[first:]
+    return pairs, blocked, opened
+
+
+def _group_pairs(tlist, pairs):
+    """Replaces the token pairs and the tokens in between by groups."""
+    if not pairs:
+        return
 
-        elif token.match(*cls.M_CLOSE):
-            try:
-                open_idx = opens.pop()
-            except IndexError:
-                # this indicates invalid sql and unbalanced tokens.
-                # instead of break, continue in case other "valid" groups exist
-                continue
-            close_idx = tidx
-            tlist.group_tokens(cls, open_idx, close_idx)
-            tidx_offset += close_idx - open_idx
+    stack = [[]]
+    ends = []
+    for idx, token in enumerate(tlist.tokens):
+        if idx in pairs:
+            end, cls = pairs[idx]
+            stack.append([])
+            ends.append((end, cls))
+        stack[-1].append(token)
+        while ends and ends[-1][0] == idx:
+            _, cls = ends.pop()
+            grp = cls(stack.pop())
+            grp.parent = tlist
+            stack[-1].append(grp)
+    tlist.tokens = stack[0]
 
 
-def group_brackets(tlist):
-    _group_matching(tlist, sql.SquareBrackets)
+def group_brackets(tlist, visit=None):
+    group_matching(tlist, (sql.SquareBrackets,))
 
 
-def group_parenthesis(tlist):
-    _group_matching(tlist, sql.Parenthesis)
+def group_parenthesis(tlist, visit=None):
+    group_matching(tlist, (sql.Parenthesis,))
 
 
-def group_case(tlist):
-    _group_matching(tlist, sql.Case)
+def group_case(tlist, visit=None):
+    group_matching(tlist, (sql.Case,))
 
 
-def group_if(tlist):
-    _group_matching(tlist, sql.If)
+def group_if(tlist, visit=None):
+    group_matching(tlist, (sql.If,))
 
 
-def group_for(tlist):
-    _group_matching(tlist, sql.For)
+def group_for(tlist, visit=None):
+    group_matching(tlist, (sql.For,))
 
 
-def group_begin(tlist):
-    _group_matching(tlist, sql.Begin)
+def group_begin(tlist, visit=None):
+    group_matching(tlist, (sql.Begin,))
 
 
-def group_typecasts(tlist):
-    def match(token):
-        return token.match(T.Punctuation, '::')
+def group_typecasts(tlist, visit=None):
+    match = M_TYPECAST
 
     def valid(token):
         return token is not None
@@ -84,17 +232,13 @@ def group_typecasts(tlist):
         return pidx, nidx
 
     valid_prev = valid_next = valid
-    _group(tlist, sql.Identifier, match, valid_prev, valid_next, post)
-
+    _group(tlist, sql.Identifier, match, valid_prev, valid_next, post,
+           visit=visit)
 
-def group_period(tlist):
-    def match(token):
-        return token.match(T.Punctuation, '.')
 
-    def valid_prev(token):
-        sqlcls = sql.SquareBrackets, sql.Identifier
-        ttypes = T.Name, T.String.Symbol
-        return imt(token, i=sqlcls, t=ttypes)
+def group_period(tlist, visit=None):
+    match = M_PERIOD
+    valid_prev = M_PERIOD_PREV
 
     def valid_next(token):
         # issue261, allow invalid next token
@@ -102,37 +246,35 @@ def group_period(tlist):
 
     def post(tlist, pidx, tidx, nidx):
         # next_ validation is being performed here. issue261
-        sqlcls = sql.SquareBrackets, sql.Function
-        ttypes = T.Name, T.String.Symbol, T.Wildcard
         next_ = tlist[nidx] if nidx is not None else None
-        valid_next = imt(next_, i=sqlcls, t=ttypes)
+        valid_next = M_PERIOD_NEXT(next_)
 
         return (pidx, nidx) if valid_next else (pidx, tidx)
 
-    _group(tlist, sql.Identifier, match, valid_prev, valid_next, post)
+    _group(tlist, sql.Identifier, match, valid_prev, valid_next, post,
+           visit=visit)
 
 
-def group_as(tlist):
+def group_as(tlist, visit=None):
     def match(token):
-        return token.normalized == 'AS'
+        return not token.is_group and token.normalized == 'AS'
 
     def valid_prev(token):
-        return token.normalized == 'NULL' or not token.is_keyword
+        return not token.is_keyword or token.normalized == 'NULL'
 
     def valid_next(token):
-        ttypes = T.DML, T.DDL
-        return not imt(token, t=ttypes)
+        return not M_AS_NEXT(token)
 
     def post(tlist, pidx, tidx, nidx):
         tlist[nidx].ttype = T.Alias
         return pidx, nidx
 
-    _group(tlist, sql.Identifier, match, valid_prev, valid_next, post)
+    _group(tlist, sql.Identifier, match, valid_prev, valid_next, post,
+           visit=visit)
 
 
-def group_assignment(tlist):
-    def match(token):
-        return token.match(T.Assignment, ':=')
+def group_assignment(tlist, visit=None):
+    match = M_ASSIGNMENT
 
     def valid(token):
         return token is not None
@@ -144,19 +286,16 @@ def group_assignment(tlist):
         return pidx, nidx
 
     valid_prev = valid_next = valid
-    _group(tlist, sql.Assignment, match, valid_prev, valid_next, post)
-
+    _group(tlist, sql.Assignment, match, valid_prev, valid_next, post,
+           visit=visit)
 
-def group_comparison(tlist):
-    sqlcls = (sql.Parenthesis, sql.Function, sql.Identifier,
-              sql.Operation)
-    ttypes = T_NUMERICAL + T_STRING + T_NAME
 
+def group_comparison(tlist, visit=None):
     def match(token):
         return token.ttype == T.Operator.Comparison
 
     def valid(token):
-        if imt(token, t=ttypes, i=sqlcls):
+        if M_COMPARISON_SIDE(token):
             return True
         elif token and token.normalized == 'NULL':
             return True
@@ -168,49 +307,35 @@ def group_comparison(tlist):
 
     valid_prev = valid_next = valid
     _group(tlist, sql.Comparison, match,
-           valid_prev, valid_next, post, extend=False)
+           valid_prev, valid_next, post, extend=False, visit=visit)
 
 
-def group_identifier(tlist):
-    ttypes = T.String.Symbol, T.Name
-
-    def match(token):
-        return imt(token, t=ttypes)
+def group_identifier(tlist, visit=None):
+    match = M_IDENTIFIER
 
     def post(tlist, pidx, tidx, nidx):
         return tidx, tidx
 
     _group(tlist, sql.Identifier, match,
-           post=post, extend=False)
+           post=post, extend=False, visit=visit)
 
 
-def group_arrays(tlist):
-    sqlcls = sql.SquareBrackets, sql.Identifier, sql.Function
-    ttypes = T.Name, T.String.Symbol
+def group_arrays(tlist, visit=None):
+    valid_prev = M_ARRAY_PREV
 
     def match(token):
         return isinstance(token, sql.SquareBrackets)
 
-    def valid_prev(token):
-        return imt(token, i=sqlcls, t=ttypes)
-
     def post(tlist, pidx, tidx, nidx):
         return pidx, tidx
 
     _group(tlist, sql.Identifier, match,
-           valid_prev, post=post, extend=True, recurse=False)
-
-
-def group_operator(tlist):
-    ttypes = T_NUMERICAL + T_STRING + T_NAME
-    sqlcls = (sql.SquareBrackets, sql.Parenthesis, sql.Function,
-              sql.Identifier, sql.Operation)
+           valid_prev, post=post, extend=True, recurse=False, visit=visit)
 
-    def match(token):
-        return imt(token, t=(T.Operator, T.Wildcard))
 
-    def valid(token):
-        return imt(token, i=sqlcls, t=ttypes)
+def group_operator(tlist, visit=None):
+    match = M_OPERATOR
+    valid = M_OPERAND
 
     def post(tlist, pidx, tidx, nidx):
         tlist[tidx].ttype = T.Operator
@@ -218,57 +343,46 @@ def group_operator(tlist):
 
     valid_prev = valid_next = valid
     _group(tlist, sql.Operation, match,
-           valid_prev, valid_next, post, extend=False)
+           valid_prev, valid_next, post, extend=False, visit=visit)
 
 
-def group_identifier_list(tlist):
-    m_role = T.Keyword, ('null', 'role')
-    sqlcls = (sql.Function, sql.Case, sql.Identifier, sql.Comparison,
-              sql.IdentifierList, sql.Operation)
-    ttypes = (T_NUMERICAL + T_STRING + T_NAME +
-              (T.Keyword, T.Comment, T.Wildcard, T.Comment.Multiline))
-
-    def match(token):
-        return token.match(T.Punctuation, ',')
-
-    def valid(token):
-        return imt(token, i=sqlcls, m=m_role, t=ttypes)
+def group_identifier_list(tlist, visit=None):
+    match = M_COMMA
+    valid = M_LIST_ITEM
 
     def post(tlist, pidx, tidx, nidx):
         return pidx, nidx
 
     valid_prev = valid_next = valid
     _group(tlist, sql.IdentifierList, match,
-           valid_prev, valid_next, post, extend=True, skip_cm=True)
+           valid_prev, valid_next, post, extend=True, skip_cm=True,
+           visit=visit)
 
 
-def group_where(tlist):
-    group_clauses(tlist, sql.Where)
+def group_where(tlist, visit=None):
+    group_clauses(tlist, sql.Where, visit=visit)
 
 
-def group_aliased(tlist):
-    sqlcls = (sql.Parenthesis, sql.Function, sql.Case, sql.Identifier,
-              sql.Operation)
-    ttypes = T.Number
+def group_aliased(tlist, visit=None):
+    valid_prev = M_ALIASED_PREV
 
     def match(token):
         return isinstance(token, sql.Identifier)
 
-    def valid_prev(token):
-        return imt(token, i=sqlcls, t=ttypes)
-
     def post(tlist, pidx, tidx, nidx):
         tlist[tidx].ttype = T.Alias
         return pidx, tidx
 
     _group(tlist, sql.Identifier, match,
-           valid_prev, post=post, extend=True)
+           valid_prev, post=post, extend=True, visit=visit)
 
 
-def group_functions(tlist):
+def group_functions(tlist, visit=None):
     has_create = False
     has_table = False
     for tmp_token in tlist.tokens:
+        if tmp_token.is_group:
+            continue
         if tmp_token.normalized == 'CREATE':
             has_create = True
         if tmp_token.normalized == 'TABLE':
@@ -279,42 +393,41 @@ def group_functions(tlist):
     def match(token):
         return isinstance(token, sql.Parenthesis)
 
-    def valid_prev(token):
-        return imt(token, t=T.Name)
+    valid_prev = M_FUNCTION_NAME
 
     def post(tlist, pidx, tidx, nidx):
         return pidx, tidx
 
     _group(tlist, sql.Function, match,
-           valid_prev, post=post, extend=False)
+           valid_prev, post=post, extend=False, visit=visit)
 
 
-def group_order(tlist):
+def group_order(tlist, visit=None):
     """Group together Identifier and Asc/Desc token"""
 
     def match(token):
         return token.ttype == T.Keyword.Order
 
-    def valid_prev(token):
-        return imt(token, i=sql.Identifier, t=T.Number)
+    valid_prev = M_ORDER_PREV
 
     def post(tlist, pidx, tidx, nidx):
         return pidx, tidx
 
     _group(tlist, sql.Identifier, match,
-           valid_prev, post=post, extend=False, recurse=False)
+           valid_prev, post=post, extend=False, recurse=False, visit=visit)
 
 
-def group(stmt, advanced=False, pre=None):
-    funcs = [
-        # _group_matching
-        group_brackets,
-        group_parenthesis,
-        group_case,
-        group_if,
-        group_for,
-        group_begin,
+def group(stmt, advanced=False, pre=None, passes=None, lazy=False):
+    """Groups the tokens of *stmt*.
+
+    *passes* is a set of the grouping functions to apply, e.g. one of
+    ``PROFILES``. Functions not in it are skipped, the order of the
+    others doesn't change. If it's ``None`` all functions are applied.
 
+    If *lazy* is ``True`` only the tokens of *stmt* are grouped. The
+    tokens of a subgroup are grouped when they're first accessed.
+    """
+    funcs = [
         group_functions,
         group_where,
         group_period,
@@ -332,14 +445,6 @@ def group(stmt, advanced=False, pre=None):
 
     ] if advanced is False else [
 
-        # _group_matching
-        group_brackets,
-        group_parenthesis,
-        group_case,
-        group_if,
-        group_for,
-        group_begin,
-
         group_select,
         group_from,
         group_where,
@@ -365,11 +470,126 @@ def group(stmt, advanced=False, pre=None):
         group_identifier_list,
     ]
 
-    for func in funcs:
-        func(stmt)
+    classes = MATCHING
+    if passes is not None:
+        classes = tuple(cls for cls, func in zip(MATCHING, MATCHING_FUNCS)
+                        if func in passes)
+        funcs = [func for func in funcs if func in passes]
+        if not classes and not funcs:
+            return stmt
+
+    group_matching(stmt, classes)
+    walk = _GroupWalk(funcs)
+    if lazy:
+        walk.start(stmt)
+    else:
+        walk.run(stmt)
     return stmt
 
 
+class _GroupWalk(object):
+    """Applies the grouping functions *funcs* in a single top-down walk.
+
+    The result is the same as calling each function on *stmt* in turn.
+    All functions are applied to a group before descending into its
+    subgroups. Every function only looks at the direct children of a
+    group, so it makes no difference when a subgroup gets grouped, as
+    long as it sees the same tokens it would have seen in between the
+    functions before and after it.
+
+    In lazy mode the walk stops after the statement. The tokens of the
+    subgroups that still have to be grouped are hidden and the walk is
+    continued for a subgroup when its tokens are accessed.
+    """
+
+    def __init__(self, funcs):
+        self.funcs = funcs
+        # subgroup -> [(function index, step, last token)] to apply later
+        self.pending = {}
+        # lazy mode: hidden subgroup -> its tokens
+        self.hidden = {}
+        self.visited = []
+        self.busy = False
+        self.visitors = [self._visitor(idx) for idx in range(len(funcs))]
+
+    def _visitor(self, idx):
+        pending, visited = self.pending, self.visited
+
+        def visit(token, step):
+            entry = idx, step, token.tokens[-1] if token.tokens else None
+            try:
+                pending[token].append(entry)
+            except KeyError:
+                pending[token] = [entry]
+                visited.append(token)
+        return visit
+
+    def run(self, stmt):
+        for func, visit in zip(self.funcs, self.visitors):
+            func(stmt, visit=visit)
+
+        stack = [stmt]
+        while stack:
+            tlist = stack.pop()
+            self._apply(tlist)
+            stack.extend(token for token in tlist.tokens if token.is_group)
+
+    def start(self, stmt):
+        self.busy = True
+        for func, visit in zip(self.funcs, self.visitors):
+            func(stmt, visit=visit)
+        self.busy = False
+        self._hide()
+
+    def tokens(self, tlist):
+        """Returns the tokens of the hidden *tlist* as they are."""
+        return self.hidden[tlist]
+
+    def __call__(self, tlist):
+        """Returns the tokens of the hidden *tlist* after grouping them.
+
+        Grouping functions may look into a hidden subgroup while another
+        group is grouped, it's hidden again afterwards.
+        """
+        tlist.tokens = self.hidden.pop(tlist)
+        tlist._lazy = None
+        self.visited.append(tlist)
+        if not self.busy:
+            self.busy = True
+            try:
+                self._apply(tlist)
+            finally:
+                self.busy = False
+            self._hide()
+        return tlist.tokens
+
+    def _hide(self):
+        for tlist in self.visited:
+            if tlist._lazy is None and tlist in self.pending:
+                self.hidden[tlist] = tlist.tokens
+                del tlist.tokens
+                tlist._lazy = self
+        del self.visited[:]
+
+    def _apply(self, tlist):
+        # Visits only come from the group's current and former parents,
+        # they are already in order.
+        for idx, step, last in self.pending.pop(tlist, ()):
+            # The parent may have appended tokens to this group after
+            # it was visited. Hide them from the step.
+            tokens = tlist.tokens
+            if last is not None:
+                while last.parent is not tlist:
+                    last = last.parent
+                if tokens[-1] is last:
+                    step(tlist, visit=self.visitors[idx])
+                    continue
+            end = tokens.index(last) + 1 if last is not None else 0
+            tlist.tokens = tokens[:end]
+            step(tlist, visit=self.visitors[idx])
+            tlist.tokens.extend(tokens[end:])
+
+
 def _group(tlist, cls, match,
            valid_prev=lambda t: True,
            valid_next=None,
@@ -377,9 +597,20 @@ def _group(tlist, cls, match,
            extend=True,
            recurse=True,
            skip_cm=False,
+           visit=None,
            ):
-    """Groups together tokens that are joined by a middle token. ie. x < y"""
-
+    """Groups together tokens that are joined by a middle token. ie. x < y
+
+    If *visit* is given it's called with each subgroup and the function
+    grouping it. Otherwise the subgroups are grouped in a walk.
+    """
+    if visit is None:
+        return _GroupWalk([partial(
+            _group, cls=cls, match=match, valid_prev=valid_prev,
+            valid_next=valid_next, post=post, extend=extend,
+            recurse=recurse, skip_cm=skip_cm)]).run(tlist)
+
+    step = None
     tidx_offset = 0
     pidx, prev_ = None, None
     for idx, token in enumerate(list(tlist)):
@@ -392,7 +623,10 @@ def _group(tlist, cls, match,
             continue
 
         if recurse and token.is_group and not isinstance(token, cls):
-            _group(token, cls, match, valid_prev, valid_next, post, extend)
+            step = step or partial(
+                _group, cls=cls, match=match, valid_prev=valid_prev,
+                valid_next=valid_next, post=post, extend=extend)
+            visit(token, step)
 
         if match(token):
             if valid_next is None:
@@ -413,7 +647,12 @@ def _group(tlist, cls, match,
         pidx, prev_ = tidx, token
 
 
-def group_clauses(tlist, cls, clause=None, i=None):
+def group_clauses(tlist, cls, clause=None, i=None, visit=None):
+    if visit is None:
+        return _GroupWalk([partial(group_clauses, cls=cls, clause=clause,
+                                   i=i)]).run(tlist)
+
+    step = None
     tidx_offset = 0
     start_idx, start_token = None, None
     for idx, token in enumerate(list(tlist)):
@@ -423,13 +662,15 @@ def group_clauses(tlist, cls, clause=None, i=None):
             continue
 
         if token.is_group and not isinstance(token, cls):
-            group_clauses(token, cls, clause, i)
+            step = step or partial(group_clauses, cls=cls, clause=clause,
+                                   i=i)
+            visit(token, step)
 
-        if token.match(*cls.M_OPEN):
+        if M_OPENS[cls](token):
             start_idx, start_token = tidx, token
             continue
 
-        if start_token is not None and token.match(*cls.M_CLOSE):
+        if start_token is not None and M_CLOSES[cls](token):
             tlist.group_tokens(cls, start_idx, tidx - 1)
             tidx_offset += tidx - 1 - start_idx
             start_idx, start_token = None, None
@@ -442,21 +683,46 @@ def group_clauses(tlist, cls, clause=None, i=None):
         tlist.group_tokens(cls, start_idx, eidx)
 
 
-def group_select(tlist):
-    group_clauses(tlist, sql.Select)
+def group_select(tlist, visit=None):
+    group_clauses(tlist, sql.Select, visit=visit)
+
+
+def group_from(tlist, visit=None):
+    group_clauses(tlist, sql.From, visit=visit)
+
+
+def group_group_by(tlist, visit=None):
+    group_clauses(tlist, sql.Group, visit=visit)
 
 
-def group_from(tlist):
-    group_clauses(tlist, sql.From)
+def group_order_by(tlist, visit=None):
+    group_clauses(tlist, sql.Order, visit=visit)
 
 
-def group_group_by(tlist):
-    group_clauses(tlist, sql.Group)
+def group_table_stmt(tlist, visit=None):
+    group_clauses(tlist, sql.Table_Group, sql.From, i=sql.Identifier,
+                  visit=visit)
 
 
-def group_order_by(tlist):
-    group_clauses(tlist, sql.Order)
+# Grouping functions for the classes in MATCHING, in the same order
+MATCHING_FUNCS = (group_brackets, group_parenthesis, group_case, group_if,
+                  group_for, group_begin)
 
+# All grouping functions group() may apply
+PASSES = frozenset(MATCHING_FUNCS + (
+    group_functions, group_where, group_period, group_arrays,
+    group_identifier, group_operator, group_order, group_typecasts,
+    group_as, group_aliased, group_assignment, group_comparison,
+    group_identifier_list, group_select, group_from, group_group_by,
+    group_order_by, group_table_stmt))
 
-def group_table_stmt(tlist):
-    group_clauses(tlist, sql.Table_Group, sql.From, i=sql.Identifier)
+# Named sets of grouping functions, None applies all of them
+PROFILES = {
+    'none': frozenset(),
+    'parenthesis': frozenset((group_brackets, group_parenthesis)),
+    'identifiers': frozenset((
+        group_brackets, group_parenthesis, group_functions, group_period,
+        group_arrays, group_identifier, group_typecasts, group_as,
+        group_aliased)),
+    'full': None,
+}
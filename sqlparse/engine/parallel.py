@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2016 Andi Albrecht, albrecht.andi@gmail.com
+#
+# This module is part of python-sqlparse and is released under
+# the BSD License: http://www.opensource.org/licenses/bsd-license.php
+
+"""Splitting of huge SQL files using multiple processes."""
+
+import collections
+import itertools
+import multiprocessing
+import os
+import re
+
+from sqlparse import lexer
+from sqlparse.engine.statement_splitter import StatementSplitter
+from sqlparse.utils import mapped_file
+
+# Number of bytes each worker splits at once
+RANGE_SIZE = 16 * 1024 * 1024
+
+# Candidate cut: a semicolon ending a line followed by a line starting with
+# a word. Whether the semicolon really ends a statement (and isn't inside
+# a string, comment or $$ body) is verified after splitting the range.
+CUT_REGEX = re.compile(br';([ \t]*)\r?\n(?=[A-Za-z])')
+
+
+def _next_cut(buf, pos, size):
+    """Returns the first candidate cut at or after *pos*, or *size*."""
+    m = CUT_REGEX.search(buf, pos)
+    if m is None:
+        return size
+    # StatementSplitter keeps whitespace after the semicolon with the
+    # statement, but a newline token right after it starts the next one.
+    return m.end() if m.group(1) else m.start() + 1
+
+
+def find_cuts(buf, size, range_size=RANGE_SIZE):
+    """Returns byte offsets cutting *buf* into ranges of about *range_size*.
+
+    The first offset is ``0``, the last one is *size*.
+    """
+    cuts = [0]
+    pos = range_size
+    while pos < size:
+        cut = _next_cut(buf, pos, size)
+        if cut == size:
+            break
+        cuts.append(cut)
+        pos = cut + range_size
+    cuts.append(size)
+    return cuts
+
+
+def _split_text(text):
+    """Splits *text*, returns ``(valid, statements)``.
+
+    *valid* is ``False`` if *text* doesn't end with a complete statement or
+    ends in an unterminated string, quoted name or comment.
+    """
+    unstable = []
+
+    def check(stream):
+        pos = 0
+        for ttype, value in stream:
+            nidx = pos + len(value)
+            if nidx < len(text) and lexer._is_unstable(
+                    text, pos, nidx, ttype, value):
+                unstable.append(pos)
+            pos = nidx
+            yield ttype, value
+
+    splitter = StatementSplitter()
+    offsets = splitter.process_offsets(check(lexer.tokenize(text)))
+    stmts = [text[sidx:eidx].strip() for sidx, eidx in offsets]
+    return splitter.consume_ws and not unstable, stmts
+
+
+def split_range(args):
+    """Splits the byte range ``start:end`` of the file at *path*.
+
+    Returns a 2-tuple ``(end, statements)``. If the original *end* isn't a
+    statement boundary (e.g. it's inside a string, comment or $$ body) the
+    range is extended to a later candidate cut, doubling its size each time
+    so a long body is lexed only a few times. The returned *end* is the
+    verified boundary the statements end at.
+    """
+    path, start, end, encoding = args
+    with mapped_file(path) as buf:
+        size = len(buf)
+        while True:
+            text = buf[start:end].decode(encoding or 'utf-8', 'replace')
+            valid, stmts = _split_text(text)
+            if valid or end == size:
+                return end, stmts
+            end = _next_cut(buf, 2 * end - start, size)
+
+
+def split_parallel(path, encoding=None, processes=None,
+                   range_size=RANGE_SIZE):
+    """Splits the SQL statements in the file at *path* in parallel.
+
+    The file is cut into byte ranges at likely statement boundaries and
+    the ranges are split by a pool of *processes* workers. A worker whose
+    range doesn't end at a statement boundary extends the range itself,
+    the ranges it covers are skipped and the rest of a range it ends in is
+    split again. Only a few ranges per worker are split ahead of the one
+    whose statements are yielded next. *encoding* has to be ASCII
+    compatible.
+
+    Yields the statements in order.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+
+    with mapped_file(path) as buf:
+        cuts = find_cuts(buf, size, range_size)
+    ranges = iter(zip(cuts[:-1], cuts[1:]))
+
+    if len(cuts) == 2:
+        for stmt in split_range((path, 0, size, encoding))[1]:
+            yield stmt
+        return
+
+    window = 2 * (processes or multiprocessing.cpu_count())
+    pool = multiprocessing.Pool(processes)
+    finished = False
+    try:
+        pending = collections.deque()
+        pos = 0
+        while True:
+            for start, end in itertools.islice(ranges,
+                                               window - len(pending)):
+                pending.append((start, end, pool.apply_async(
+                    split_range, ((path, start, end, encoding),))))
+            if not pending:
+                break
+
+            start, end, result = pending.popleft()
+            if end <= pos:
+                # Covered by an extended range.
+                continue
+            if start != pos:
+                result = pool.apply_async(split_range, ((path, pos, end,
+                                                         encoding),))
+            pos, stmts = result.get()
+            for stmt in stmts:
+                yield stmt
+        finished = True
+    finally:
+        # Terminating the pool while tasks are queued may hang, it's
+        # only done if the generator is abandoned.
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
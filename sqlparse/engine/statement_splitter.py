@@ -121,3 +121,30 @@ class StatementSplitter(object):
         # Yield pending statement (if any)
         if self.tokens:
             yield sql.Statement(self.tokens)
+
+    def process_offsets(self, stream):
+        """Process the stream yielding ``(start, end)`` offsets of statements.
+
+        Works like :meth:`process` but only tracks the position in the
+        source text instead of building :class:`~sqlparse.sql.Token`
+        instances. Slicing the source with the offsets gives the same text
+        as the statements returned by :meth:`process`.
+        """
+        EOS_TTYPE = T.Whitespace, T.Comment.Single
+
+        start = pos = 0
+        for ttype, value in stream:
+            if self.consume_ws and ttype not in EOS_TTYPE:
+                yield start, pos
+
+                self._reset()
+                start = pos
+
+            self.level += self._change_splitlevel(ttype, value)
+            pos += len(value)
+
+            if self.level <= 0 and ttype is T.Punctuation and value == ';':
+                self.consume_ws = True
+
+        if pos > start:
+            yield start, pos
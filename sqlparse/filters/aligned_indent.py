@@ -7,10 +7,33 @@
 
 from sqlparse import sql, tokens as T
 from sqlparse.compat import text_type
-from sqlparse.utils import offset, indent
+from sqlparse.utils import LineTracker, Matcher, offset, indent
 
 
 class AlignedIndentFilter(object):
+    """Aligns the keywords and the identifiers of the statements.
+
+    The filter only holds the options, the statements of a run are
+    processed by an :class:`AlignedIndentContext` keeping the state.
+    """
+
+    def __init__(self, char=' ', n='\n'):
+        self.n = n
+        self.char = char
+        self._context = None
+
+    def context(self):
+        """Returns a new context to process the statements of a run."""
+        return AlignedIndentContext(self)
+
+    def process(self, stmt):
+        # Statements processed without a FilterStack share a context.
+        if self._context is None:
+            self._context = self.context()
+        return self._context.process(stmt)
+
+
+class AlignedIndentContext(object):
     join_words = (r'((LEFT\s+|RIGHT\s+|FULL\s+)?'
                   r'(INNER\s+|OUTER\s+|STRAIGHT\s+)?|'
                   r'(CROSS\s+|NATURAL\s+)?)?JOIN\b')
@@ -20,13 +43,18 @@ class AlignedIndentFilter(object):
                    'GROUP', 'HAVING', 'LIMIT',
                    'ORDER', 'UNION', 'VALUES',
                    '\bSET\b', 'BETWEEN', 'EXCEPT')
+    M_JOIN = Matcher(m=(T.Keyword, join_words, True))
+    M_SPLIT = Matcher(m=(T.Keyword, split_words, True))
+    M_SELECT = Matcher(m=(T.DML, 'SELECT'))
+    M_END = Matcher(m=(T.Keyword, 'END'))
 
-    def __init__(self, char=' ', n='\n'):
-        self.n = n
+    def __init__(self, filter_):
+        self.n = filter_.n
         self.offset = 0
         self.indent = 0
-        self.char = char
+        self.char = filter_.char
         self.curr_stmt = None
+        self._lines = None
         self._max_kwd_len = len('select')
 
     def nl(self, offset=1):
@@ -40,21 +68,25 @@ class AlignedIndentFilter(object):
     def _process_statement(self, tlist):
         if tlist.tokens[0].is_whitespace and self.indent == 0:
             tlist.tokens.pop(0)
+            tlist._reset_value()
+            self._lines.changed()
 
         # process the main query body
         self._process_default(tlist)
 
     def _process_parenthesis(self, tlist):
         # if this isn't a subquery, don't re-indent
-        _, token = tlist.token_next_by(m=(T.DML, 'SELECT'))
+        _, token = tlist.token_next_by(m=self.M_SELECT)
         if token is not None:
             with indent(self):
                 tlist.insert_after(tlist[0], self.nl('SELECT'))
+                self._lines.changed()
                 # process the inside of the parantheses
                 self._process_default(tlist)
 
             # de-indent last parenthesis
             tlist.insert_before(tlist[-1], self.nl())
+            self._lines.changed()
         else:
             with offset(self, -1):
                 self._process_default(tlist)
@@ -64,14 +96,17 @@ class AlignedIndentFilter(object):
         identifiers = list(tlist.get_identifiers())
         t0 = identifiers.pop(0)
         with offset(self, self.get_offset(t0)):
-            [tlist.insert_before(token, self.nl(0)) for token in
-             identifiers]
+            tidx = 0
+            for token in identifiers:
+                tidx = tlist.token_index(token, tidx)
+                tlist.insert_before(tidx, self.nl(0))
+            self._lines.changed()
         self._process_default(tlist)
 
     def _process_case(self, tlist):
         cases = tlist.get_cases(skip_ws=True)
         # align the end as well
-        _, end_token = tlist.token_next_by(m=(T.Keyword, 'END'))
+        _, end_token = tlist.token_next_by(m=self.M_END)
         cases.append((None, [end_token]))
 
         condition_width = [len(' '.join(map(text_type, cond))) if cond else 0
@@ -88,10 +123,12 @@ class AlignedIndentFilter(object):
             if i > 0:
                 tlist.insert_before(stmt, self.nl(
                     offset_ - len(text_type(stmt)) + 4))
+                self._lines.changed()
             if cond:
                 ws = sql.Token(T.Whitespace, self.char * (
                     max_cond_width - condition_width[i]))
                 tlist.insert_after(cond[-1], ws)
+                self._lines.changed()
 
     def _process_default(self, tlist):
         tidx_offset = 0
@@ -109,7 +146,7 @@ class AlignedIndentFilter(object):
                 with offset(self, offset_):
                     self._process(token)
 
-            if not token.match(T.Keyword, self.split_words, regex=True):
+            if not self.M_SPLIT(token):
                 prev_tk = token
                 continue
 
@@ -122,12 +159,13 @@ class AlignedIndentFilter(object):
                 prev_kw = token
                 continue
 
-            if token.match(T.Keyword, self.join_words, regex=True):
+            if self.M_JOIN(token):
                 token_indent = token.value.split()[0]
             else:
                 token_indent = text_type(token)
 
             tlist.insert_before(tidx, self.nl(token_indent))
+            self._lines.changed()
             tidx_offset += 1
 
             prev_kw = prev_tk = token
@@ -139,6 +177,7 @@ class AlignedIndentFilter(object):
 
     def process(self, stmt):
         self.curr_stmt = stmt
+        self._lines = LineTracker(stmt)
         self._process(stmt)
         return stmt
 
@@ -147,16 +186,5 @@ class AlignedIndentFilter(object):
         return (self._max_kwd_len + self.offset +
                 self.indent * (2 + self._max_kwd_len))
 
-    def flatten_up_to(self, token):
-        """Yields all tokens up to token but excluding current."""
-        if isinstance(token, sql.TokenList):
-            token = next(token.flatten())
-
-        for t in self.curr_stmt.flatten():
-            if t == token:
-                raise StopIteration
-            yield t
-
     def get_offset(self, token):
-        raw = ''.join(map(text_type, self.flatten_up_to(token)))
-        return len(raw.splitlines()[-1]) - self.leading_ws
+        return self._lines.column(token) - self.leading_ws
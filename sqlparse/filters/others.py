@@ -6,35 +6,75 @@
 # the BSD License: http://www.opensource.org/licenses/bsd-license.php
 
 from sqlparse import sql, tokens as T
-from sqlparse.utils import split_unquoted_newlines
+from sqlparse.utils import Matcher, split_unquoted_newlines
+
+
+def _reset_values(tlists):
+    """Drops the cached values of *tlists* and their parents.
+
+    Each group is visited once, even if many of its children changed.
+    The navigation indexes of *tlists* are dropped too.
+    """
+    reset = set()
+    for tlist in tlists:
+        tlist._nav = None
+        while tlist is not None and tlist not in reset:
+            tlist._value = None
+            reset.add(tlist)
+            tlist = tlist.parent
+
+
+def _sublists(stmt):
+    """Returns *stmt* and all its subgroups, parents before children.
+
+    The groups are collected with an explicit stack instead of recursion.
+    """
+    tlists = []
+    stack = [stmt]
+    while stack:
+        tlist = stack.pop()
+        tlists.append(tlist)
+        stack.extend(tlist.get_sublists())
+    return tlists
 
 
 class StripWhitespaceFilter(object):
+    # The _stripws methods return True if they changed the group.
+
     def _stripws(self, tlist):
         func_name = '_stripws_{cls}'.format(cls=type(tlist).__name__)
         func = getattr(self, func_name.lower(), self._stripws_default)
-        func(tlist)
+        return func(tlist)
 
     @staticmethod
     def _stripws_default(tlist):
         last_was_ws = False
         is_first_char = True
-        for token in list(tlist.tokens):
+        changed = False
+        tokens = []
+        for token in tlist.tokens:
             if token.is_whitespace:
                 if last_was_ws or is_first_char:
-                    tlist.tokens.remove(token)
                     continue  # continue to remove multiple ws on first char
-                else:
+                elif token.value != ' ':
                     token.value = ' '
+                    changed = True
+            tokens.append(token)
             last_was_ws = token.is_whitespace
             is_first_char = False
+        if len(tokens) != len(tlist.tokens):
+            tlist.tokens[:] = tokens
+            changed = True
+        return changed
 
     def _stripws_identifierlist(self, tlist):
         # Removes newlines before commas, see issue140
         last_nl = None
-        for token in list(tlist.tokens):
+        tokens = []
+        for token in tlist.tokens:
             if last_nl and token.ttype is T.Punctuation and token.value == ',':
-                tlist.tokens.remove(last_nl)
+                tokens.pop()
+            tokens.append(token)
             last_nl = token if token.is_whitespace else None
 
             # # Add space after comma.
@@ -42,45 +82,77 @@ class StripWhitespaceFilter(object):
             # if (next_ is not None and not next_.is_whitespace and
             #             token.ttype is T.Punctuation and token.value == ','):
             #     tlist.insert_after(token, sql.Token(T.Whitespace, ' '))
-        return self._stripws_default(tlist)
+        changed = len(tokens) != len(tlist.tokens)
+        if changed:
+            tlist.tokens[:] = tokens
+        return self._stripws_default(tlist) or changed
 
     def _stripws_parenthesis(self, tlist):
-        while tlist.tokens[1].is_whitespace:
-            tlist.tokens.pop(1)
-        while tlist.tokens[-2].is_whitespace:
-            tlist.tokens.pop(-2)
-        self._stripws_default(tlist)
+        tokens = tlist.tokens
+        size = len(tokens)
+        idx = 1
+        while tokens[idx].is_whitespace:
+            idx += 1
+        del tokens[1:idx]
+        idx = len(tokens) - 2
+        while tokens[idx].is_whitespace:
+            idx -= 1
+        del tokens[idx + 1:-1]
+        return self._stripws_default(tlist) or len(tokens) != size
 
     def process(self, stmt, depth=0):
-        [self.process(sgroup, depth + 1) for sgroup in stmt.get_sublists()]
-        self._stripws(stmt)
+        # Subgroups are stripped before their parents.
+        changed = [tlist for tlist in reversed(_sublists(stmt))
+                   if self._stripws(tlist)]
         if depth == 0 and stmt.tokens and stmt.tokens[-1].is_whitespace:
             stmt.tokens.pop(-1)
+            changed.append(stmt)
+        _reset_values(changed)
         return stmt
 
 
 class SpacesAroundOperatorsFilter(object):
-    @staticmethod
-    def _process(tlist):
-
-        ttypes = (T.Operator, T.Comparison)
-        tidx, token = tlist.token_next_by(t=ttypes)
-        while token:
-            nidx, next_ = tlist.token_next(tidx, skip_ws=False)
-            if next_ and next_.ttype != T.Whitespace:
-                tlist.insert_after(tidx, sql.Token(T.Whitespace, ' '))
+    M_OPERATOR = Matcher(t=(T.Operator, T.Comparison))
+
+    def _process(self, tlist):
+        # The spaces are added while copying the tokens, the list is
+        # replaced once. Like insert_after() does, the space following an
+        # operator goes in front of the next non-whitespace token.
+        tokens = []
+        space_next = False
+        last = len(tlist.tokens) - 1
+        for idx, token in enumerate(tlist.tokens):
+            if space_next and not token.is_whitespace:
+                tokens.append(self._space(tlist))
+                space_next = False
+
+            if not self.M_OPERATOR(token):
+                tokens.append(token)
+                continue
+
+            if tokens and tokens[-1].ttype != T.Whitespace:
+                tokens.append(self._space(tlist))
+            tokens.append(token)
+            space_next = (idx < last and
+                          tlist.tokens[idx + 1].ttype != T.Whitespace)
+
+        if space_next:
+            tokens.append(self._space(tlist))
+        if len(tokens) == len(tlist.tokens):
+            return False
+        tlist.tokens[:] = tokens
+        return True
 
-            pidx, prev_ = tlist.token_prev(tidx, skip_ws=False)
-            if prev_ and prev_.ttype != T.Whitespace:
-                tlist.insert_before(tidx, sql.Token(T.Whitespace, ' '))
-                tidx += 1  # has to shift since token inserted before it
-
-            # assert tlist.token_index(token) == tidx
-            tidx, token = tlist.token_next_by(t=ttypes, idx=tidx)
+    @staticmethod
+    def _space(parent):
+        token = sql.Token(T.Whitespace, ' ')
+        token.parent = parent
+        return token
 
     def process(self, stmt):
-        [self.process(sgroup) for sgroup in stmt.get_sublists()]
-        SpacesAroundOperatorsFilter._process(stmt)
+        # Arithmetic nests deeply, _sublists() doesn't recurse.
+        _reset_values([tlist for tlist in reversed(_sublists(stmt))
+                       if self._process(tlist)])
         return stmt
 
 
@@ -92,3 +164,11 @@ class SerializerUnicode(object):
     def process(stmt):
         lines = split_unquoted_newlines(stmt)
         return '\n'.join(line.rstrip() for line in lines)
+
+    @staticmethod
+    def write(stmt, stream):
+        """Writes the lines of *stmt* to the file-like object *stream*."""
+        lines = split_unquoted_newlines(stmt)
+        stream.write(lines[0].rstrip())
+        for line in lines[1:]:
+            stream.write('\n' + line.rstrip())
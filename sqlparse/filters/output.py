@@ -14,27 +14,49 @@ class OutputFilter(object):
 
     def __init__(self, varname='sql'):
         self.varname = self.varname_prefix + varname
-        self.count = 0
+        self._context = None
 
-    def _process(self, stream, varname, has_nl):
+    def _process(self, stream, varname, has_nl, count):
         raise NotImplementedError
 
+    def context(self):
+        """Returns a new context to process the statements of a run."""
+        return OutputContext(self)
+
+    def process(self, stmt):
+        # Statements processed without a FilterStack share a context.
+        if self._context is None:
+            self._context = self.context()
+        return self._context.process(stmt)
+
+
+class OutputContext(object):
+    """Numbers the variables of the statements of a run."""
+
+    def __init__(self, filter_):
+        self.filter = filter_
+        self.count = 0
+
     def process(self, stmt):
         self.count += 1
         if self.count > 1:
-            varname = '{f.varname}{f.count}'.format(f=self)
+            varname = '{0}{1}'.format(self.filter.varname, self.count)
         else:
-            varname = self.varname
+            varname = self.filter.varname
 
         has_nl = len(text_type(stmt).strip().splitlines()) > 1
-        stmt.tokens = self._process(stmt.tokens, varname, has_nl)
+        # Groups contain line breaks inserted by the reindent filters,
+        # the tokens are written ungrouped.
+        stmt.tokens = list(self.filter._process(
+            list(stmt.flatten()), varname, has_nl, self.count))
+        stmt._reset_value()
         return stmt
 
 
 class OutputPythonFilter(OutputFilter):
-    def _process(self, stream, varname, has_nl):
+    def _process(self, stream, varname, has_nl, count):
         # SQL query asignation to varname
-        if self.count > 1:
+        if count > 1:
             yield sql.Token(T.Whitespace, '\n')
         yield sql.Token(T.Name, varname)
         yield sql.Token(T.Whitespace, ' ')
@@ -78,9 +100,9 @@ class OutputPythonFilter(OutputFilter):
 class OutputPHPFilter(OutputFilter):
     varname_prefix = '$'
 
-    def _process(self, stream, varname, has_nl):
+    def _process(self, stream, varname, has_nl, count):
         # SQL query asignation to varname (quote header)
-        if self.count > 1:
+        if count > 1:
             yield sql.Token(T.Whitespace, '\n')
         yield sql.Token(T.Name, varname)
         yield sql.Token(T.Whitespace, ' ')
@@ -7,49 +7,69 @@
 
 from sqlparse import sql, tokens as T
 from sqlparse.compat import text_type
-from sqlparse.utils import offset, indent
+from sqlparse.utils import LineTracker, Matcher, offset, indent
 
 
 class ReindentFilter(object):
+    """Changes the indentation of the statements.
+
+    The filter only holds the options, the statements of a run are
+    processed by a :class:`ReindentContext` keeping the state.
+    """
+
     def __init__(self, width=2, char=' ', wrap_after=0, n='\n'):
         self.n = n
         self.width = width
         self.char = char
+        self.wrap_after = wrap_after
+        self._context = None
+
+    def context(self):
+        """Returns a new context to process the statements of a run."""
+        return ReindentContext(self)
+
+    def process(self, stmt):
+        # Statements processed without a FilterStack share a context.
+        if self._context is None:
+            self._context = self.context()
+        return self._context.process(stmt)
+
+
+class ReindentContext(object):
+    split_words = ('FROM', 'STRAIGHT_JOIN$', 'JOIN$', 'AND', 'OR',
+                   'GROUP', 'ORDER', 'UNION', 'VALUES',
+                   'SET', 'BETWEEN', 'EXCEPT', 'HAVING')
+    M_SPLIT = Matcher(m=(T.Keyword, split_words, True))
+    M_STATEMENT = Matcher(t=(T.Keyword.DML, T.Keyword.DDL))
+    M_WHERE = Matcher(m=(T.Keyword, 'WHERE'))
+    M_OPEN = Matcher(m=sql.Parenthesis.M_OPEN)
+    M_CASE_END = Matcher(m=sql.Case.M_CLOSE)
+
+    def __init__(self, filter_):
+        self.n = filter_.n
+        self.width = filter_.width
+        self.char = filter_.char
         self.indent = 0
         self.offset = 0
-        self.wrap_after = wrap_after
+        self.wrap_after = filter_.wrap_after
         self._curr_stmt = None
         self._last_stmt = None
-
-    def _flatten_up_to_token(self, token):
-        """Yields all tokens up to token but excluding current."""
-        if token.is_group:
-            token = next(token.flatten())
-
-        for t in self._curr_stmt.flatten():
-            if t == token:
-                raise StopIteration
-            yield t
+        self._lines = None
 
     @property
     def leading_ws(self):
         return self.offset + self.indent * self.width
 
     def _get_offset(self, token):
-        raw = ''.join(map(text_type, self._flatten_up_to_token(token)))
-        line = (raw or '\n').splitlines()[-1]
+        column = self._lines.column(token)
         # Now take current offset into account and return relative offset.
-        return len(line) - len(self.char * self.leading_ws)
+        return column - len(self.char * self.leading_ws)
 
     def nl(self):
         return sql.Token(T.Whitespace, self.n + self.char * self.leading_ws)
 
     def _next_token(self, tlist, idx=-1):
-        split_words = ('FROM', 'STRAIGHT_JOIN$', 'JOIN$', 'AND', 'OR',
-                       'GROUP', 'ORDER', 'UNION', 'VALUES',
-                       'SET', 'BETWEEN', 'EXCEPT', 'HAVING')
-        m_split = T.Keyword, split_words, True
-        tidx, token = tlist.token_next_by(m=m_split, idx=idx)
+        tidx, token = tlist.token_next_by(m=self.M_SPLIT, idx=idx)
 
         if token and token.normalized == 'BETWEEN':
             tidx, token = self._next_token(tlist, tidx)
@@ -67,27 +87,30 @@ class ReindentFilter(object):
 
             if prev_ and prev_.is_whitespace:
                 del tlist.tokens[pidx]
+                tlist._reset_value()
                 tidx -= 1
 
             if not (uprev.endswith('\n') or uprev.endswith('\r')):
                 tlist.insert_before(tidx, self.nl())
                 tidx += 1
+            self._lines.changed()
 
             tidx, token = self._next_token(tlist, tidx)
 
     def _split_statements(self, tlist):
-        ttypes = T.Keyword.DML, T.Keyword.DDL
-        tidx, token = tlist.token_next_by(t=ttypes)
+        tidx, token = tlist.token_next_by(m=self.M_STATEMENT)
         while token:
             pidx, prev_ = tlist.token_prev(tidx, skip_ws=False)
             if prev_ and prev_.is_whitespace:
                 del tlist.tokens[pidx]
+                tlist._reset_value()
                 tidx -= 1
             # only break if it's not the first token
             if prev_:
                 tlist.insert_before(tidx, self.nl())
                 tidx += 1
-            tidx, token = tlist.token_next_by(t=ttypes, idx=tidx)
+            self._lines.changed()
+            tidx, token = tlist.token_next_by(m=self.M_STATEMENT, idx=tidx)
 
     def _process(self, tlist):
         func_name = '_process_{cls}'.format(cls=type(tlist).__name__)
@@ -95,20 +118,22 @@ class ReindentFilter(object):
         func(tlist)
 
     def _process_where(self, tlist):
-        tidx, token = tlist.token_next_by(m=(T.Keyword, 'WHERE'))
+        tidx, token = tlist.token_next_by(m=self.M_WHERE)
         # issue121, errors in statement fixed??
         tlist.insert_before(tidx, self.nl())
+        self._lines.changed()
 
         with indent(self):
             self._process_default(tlist)
 
     def _process_parenthesis(self, tlist):
-        ttypes = T.Keyword.DML, T.Keyword.DDL
-        _, is_dml_dll = tlist.token_next_by(t=ttypes)
-        fidx, first = tlist.token_next_by(m=sql.Parenthesis.M_OPEN)
+        _, is_dml_dll = tlist.token_next_by(m=self.M_STATEMENT)
+        fidx, first = tlist.token_next_by(m=self.M_OPEN)
 
         with indent(self, 1 if is_dml_dll else 0):
-            tlist.tokens.insert(0, self.nl()) if is_dml_dll else None
+            if is_dml_dll:
+                tlist.insert_before(0, self.nl())
+                self._lines.changed()
             with offset(self, self._get_offset(first) + 1):
                 self._process_default(tlist, not is_dml_dll)
 
@@ -119,11 +144,14 @@ class ReindentFilter(object):
         if not tlist.within(sql.Function):
             with offset(self, num_offset):
                 position = 0
+                tidx = 0
                 for token in identifiers:
                     # Add 1 for the "," separator
                     position += len(token.value) + 1
                     if position > (self.wrap_after - self.offset):
-                        tlist.insert_before(token, self.nl())
+                        tidx = tlist.token_index(token, tidx)
+                        tlist.insert_before(tidx, self.nl())
+                        self._lines.changed()
                         position = 0
         self._process_default(tlist)
 
@@ -137,13 +165,15 @@ class ReindentFilter(object):
                 for cond, value in iterable:
                     token = value[0] if cond is None else cond[0]
                     tlist.insert_before(token, self.nl())
+                    self._lines.changed()
 
                 # Line breaks on group level are done. let's add an offset of
                 # len "when ", "then ", "else "
                 with offset(self, len("WHEN ")):
                     self._process_default(tlist)
-            end_idx, end = tlist.token_next_by(m=sql.Case.M_CLOSE)
+            end_idx, end = tlist.token_next_by(m=self.M_CASE_END)
             tlist.insert_before(end_idx, self.nl())
+            self._lines.changed()
 
     def _process_default(self, tlist, stmts=True):
         self._split_statements(tlist) if stmts else None
@@ -152,11 +182,12 @@ class ReindentFilter(object):
 
     def process(self, stmt):
         self._curr_stmt = stmt
+        self._lines = LineTracker(stmt)
         self._process(stmt)
 
         if self._last_stmt is not None:
             nl = '\n' if text_type(self._last_stmt).endswith('\n') else '\n\n'
-            stmt.tokens.insert(0, sql.Token(T.Whitespace, nl))
+            stmt.insert_before(0, sql.Token(T.Whitespace, nl))
 
         self._last_stmt = stmt
         return stmt
@@ -8,6 +8,8 @@
 """SQL formatter"""
 
 from sqlparse import filters
+from sqlparse.compat import string_types
+from sqlparse.engine import FilterStack, grouping as grouping_
 from sqlparse.exceptions import SQLParseError
 
 
@@ -107,6 +109,28 @@ def validate_options(options):
             raise SQLParseError('right_margin requires an integer > 10')
     options['right_margin'] = right_margin
 
+    grouping = options.get('grouping', 'full')
+    if isinstance(grouping, string_types):
+        if grouping not in grouping_.PROFILES:
+            raise SQLParseError('Invalid value for grouping: '
+                                '{0!r}'.format(grouping))
+        grouping = grouping_.PROFILES[grouping]
+    elif grouping is not None:
+        try:
+            grouping = frozenset(grouping)
+        except TypeError:
+            raise SQLParseError('Invalid value for grouping: '
+                                '{0!r}'.format(grouping))
+        for func in grouping - grouping_.PASSES:
+            raise SQLParseError('Unknown grouping function: '
+                                '{0!r}'.format(func))
+    options['grouping'] = grouping
+
+    lazy = options.get('lazy', False)
+    if lazy not in [True, False]:
+        raise SQLParseError('Invalid value for lazy: '
+                            '{0!r}'.format(lazy))
+
     return options
 
 
@@ -172,3 +196,42 @@ def build_filter_stack(stack, options):
             stack.postprocess.append(fltr)
 
     return stack
+
+
+class Formatter(object):
+    """Formats SQL according to *options*.
+
+    The options are validated and the filters are set up once, use a
+    formatter to format many statements with the same options. It can
+    be shared between threads.
+
+    Available options are documented in :ref:`formatting`.
+    """
+
+    def __init__(self, **options):
+        self.options = validate_options(options)
+        self._stack = build_filter_stack(FilterStack(), self.options)
+
+    def format(self, sql, encoding=None):
+        """Returns the formatted *sql* as string."""
+        return ''.join(self.format_stream(sql, encoding))
+
+    def format_stream(self, stream, encoding=None):
+        """Formats the SQL read from the file-like object *stream*.
+
+        Returns a generator of the formatted statements.
+        """
+        serializer = filters.SerializerUnicode()
+        return (serializer.process(stmt)
+                for stmt in self._stack.run(stream, encoding))
+
+    def format_to(self, fileobj, sql, encoding=None):
+        """Writes the formatted *sql* to the text file *fileobj*.
+
+        *sql* is a string or a file-like object. The statements are
+        written as soon as they are formatted, the formatted SQL is never
+        held in memory as a whole.
+        """
+        serializer = filters.SerializerUnicode()
+        for stmt in self._stack.run(sql, encoding):
+            serializer.write(stmt, fileobj)
@@ -89,7 +89,18 @@ SQL_REGEX = {
     ]}
 
 FLAGS = re.IGNORECASE | re.UNICODE
-SQL_REGEX = [(re.compile(rx, FLAGS).match, tt) for rx, tt in SQL_REGEX['root']]
+SQL_PATTERNS = [(re.compile(rx, FLAGS), tt) for rx, tt in SQL_REGEX['root']]
+SQL_REGEX = [(regex.match, tt) for regex, tt in SQL_PATTERNS]
+
+# All rules joined into a single alternation. Each rule is wrapped in a named
+# group ``rN`` so the rule that matched can be looked up by the group name.
+# Alternatives are tried in order, so the first matching rule wins just like
+# when trying the rules one after another.
+SQL_REGEX_COMBINED = re.compile('|'.join(
+    '(?P<r{0}>{1})'.format(i, regex.pattern)
+    for i, (regex, tt) in enumerate(SQL_PATTERNS)), FLAGS)
+SQL_REGEX_ACTIONS = dict(('r{0}'.format(i), tt)
+                         for i, (regex, tt) in enumerate(SQL_PATTERNS))
 
 KEYWORDS = {
     'ABORT': tokens.Keyword,
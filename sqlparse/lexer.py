@@ -12,12 +12,128 @@
 # It's separated from the rest of pygments to increase performance
 # and to allow some customizations.
 
+import codecs
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
 from sqlparse import tokens
-from sqlparse.keywords import SQL_REGEX
-from sqlparse.compat import StringIO, string_types, u
+from sqlparse.keywords import (SQL_PATTERNS, SQL_REGEX, SQL_REGEX_COMBINED,
+                               SQL_REGEX_ACTIONS)
+from sqlparse.compat import string_types, u, unichr
 from sqlparse.utils import consume
 
 
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_NOT_DIGIT: r'\D',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_NOT_SPACE: r'\S',
+    sre_parse.CATEGORY_WORD: r'\w',
+    sre_parse.CATEGORY_NOT_WORD: r'\W',
+}
+_ASCII = [unichr(i) for i in range(128)]
+
+
+def _single_char_regex(op, av):
+    """Returns the regex source for a single character item or ``None``."""
+    if op is sre_parse.LITERAL:
+        return re.escape(unichr(av))
+    elif op is sre_parse.NOT_LITERAL:
+        return '[^{0}]'.format(re.escape(unichr(av)))
+    elif op is sre_parse.ANY:
+        return '.'
+    elif op is not sre_parse.IN:
+        return None
+
+    items = []
+    for iop, iav in av:
+        if iop is sre_parse.NEGATE:
+            items.append('^')
+        elif iop is sre_parse.LITERAL:
+            items.append(re.escape(unichr(iav)))
+        elif iop is sre_parse.RANGE:
+            items.append('{0}-{1}'.format(re.escape(unichr(iav[0])),
+                                          re.escape(unichr(iav[1]))))
+        elif iop is sre_parse.CATEGORY and iav in _CATEGORIES:
+            items.append(_CATEGORIES[iav])
+        else:
+            return None
+    return '[{0}]'.format(''.join(items))
+
+
+def _first_chars(items, flags):
+    """Returns ``(chars, nullable)`` for a parsed regular expression.
+
+    *chars* is the set of ASCII characters a match can start with or
+    ``None`` if the analysis can't tell. *nullable* is ``True`` if the
+    expression can match without consuming a character.
+    """
+    chars = set()
+    for op, av in items:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            # zero-width, the next item decides
+            continue
+        elif op is sre_parse.SUBPATTERN:
+            first, nullable = _first_chars(av[-1], flags)
+        elif op is sre_parse.BRANCH:
+            first, nullable = set(), False
+            for branch in av[1]:
+                bfirst, bnullable = _first_chars(branch, flags)
+                if bfirst is None:
+                    return None, False
+                first |= bfirst
+                nullable = nullable or bnullable
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            first, nullable = _first_chars(av[2], flags)
+            nullable = nullable or av[0] == 0
+        else:
+            regex = _single_char_regex(op, av)
+            if regex is None:
+                return None, False
+            match = re.compile(regex, flags).match
+            first, nullable = set(c for c in _ASCII if match(c)), False
+
+        if first is None:
+            return None, False
+        chars |= first
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _build_dispatch(patterns):
+    """Maps ASCII characters to the rules that may match starting there.
+
+    Rules keep their original order. Characters outside of ASCII aren't
+    in the table and need to try all rules.
+    """
+    firsts = []
+    for regex, action in patterns:
+        chars, nullable = _first_chars(
+            sre_parse.parse(regex.pattern, regex.flags), regex.flags)
+        firsts.append(None if nullable else chars)
+
+    return dict((char, [(regex.match, action)
+                        for (regex, action), first in zip(patterns, firsts)
+                        if first is None or char in first])
+                for char in _ASCII)
+
+
+# Precomputed at import time, see Lexer.get_tokens
+SQL_DISPATCH = _build_dispatch(SQL_PATTERNS)
+
+# Number of characters (or bytes) read at once by tokenize_stream
+CHUNK_SIZE = 64 * 1024
+
+# The start of a %(name)s placeholder at the end of a buffer, lexed as
+# separate tokens until the rest of it is read
+_PLACEHOLDER_START = re.compile(r'%\(\w*\)?\Z')
+
+
 class Lexer(object):
     """Lexer
     Empty class. Leaving for backwards-compatibility
@@ -37,14 +153,12 @@ class Lexer(object):
 
         ``stack`` is the inital stack (default: ``['root']``)
         """
-        if isinstance(text, string_types):
-            text = u(text, encoding)
-        elif isinstance(text, StringIO):
-            text = u(text.read(), encoding)
+        text = _to_text(text, encoding)
 
         iterable = enumerate(text)
         for pos, char in iterable:
-            for rexmatch, action in SQL_REGEX:
+            # Only try the rules that can start with the current character
+            for rexmatch, action in SQL_DISPATCH.get(char, SQL_REGEX):
                 m = rexmatch(text, pos)
 
                 if not m:
@@ -60,10 +174,161 @@ class Lexer(object):
                 yield tokens.Error, char
 
 
-def tokenize(sql, encoding=None):
+class CombinedLexer(Lexer):
+    """Lexer matching all rules with a single regular expression.
+
+    Instead of trying each rule in turn at every position, the rules are
+    compiled into one alternation. Each token costs a single ``match()``
+    call. The generated token stream is identical to the one of
+    :class:`Lexer`.
+    """
+
+    @staticmethod
+    def get_tokens(text, encoding=None):
+        """
+        Return an iterable of (tokentype, value) pairs generated from
+        `text`.
+        """
+        text = _to_text(text, encoding)
+
+        match = SQL_REGEX_COMBINED.match
+        pos, end = 0, len(text)
+        while pos < end:
+            m = match(text, pos)
+
+            if not m:
+                yield tokens.Error, text[pos]
+                pos += 1
+                continue
+
+            action = SQL_REGEX_ACTIONS[m.lastgroup]
+            if isinstance(action, tokens._TokenType):
+                yield action, m.group()
+            elif callable(action):
+                yield action(m.group())
+            pos = m.end()
+
+
+def _to_text(text, encoding=None):
+    """Returns the text to tokenize as unicode string."""
+    if isinstance(text, string_types):
+        text = u(text, encoding)
+    elif hasattr(text, 'read'):
+        text = u(text.read(), encoding)
+    return text
+
+
+def _is_unstable(text, start, end, ttype, value):
+    """Returns ``True`` if more text could change the token at *start*.
+
+    Applies to a token lexed from a buffer holding only a part of the
+    input. Either the match hit the end of the buffer or the token is
+    the remainder of a string, comment or quoted name whose closing
+    part hasn't been read yet, or the start of a placeholder.
+    """
+    char = text[start]
+    if end == len(text):
+        return True
+    elif char in (u"'", u'`', u'\xb4'):
+        return ttype not in tokens.String and ttype not in tokens.Name
+    elif char == '"':
+        # a double quoted name can't span a newline, the newline may only
+        # be the last character before the closing quote.
+        nl = text.find('\n', end)
+        return ttype is tokens.Error and not 0 < nl < len(text) - 1
+    elif char == '[':
+        return ttype is not tokens.Name and text.find(']', end) == -1
+    elif text.startswith('/*', start):
+        return ttype not in tokens.Comment
+    elif char == '%':
+        return _PLACEHOLDER_START.match(text, start) is not None
+    return False
+
+
+def tokenize_stream(stream, encoding=None, chunk_size=CHUNK_SIZE):
+    """Tokenize the contents of the file-like object *stream*.
+
+    The stream is read in chunks of *chunk_size* characters (or bytes).
+    Tokens that might continue in the next chunk are held back and lexed
+    again once more text is available. Memory use is bounded by the
+    largest single token rather than by the size of the input. The
+    generated token stream is identical to the one of :class:`Lexer`.
+
+    Bytes are decoded with *encoding*, UTF-8 by default. Undecodable
+    bytes are replaced with U+FFFD instead of raising an error.
+    """
+    decoder = None
+    match = SQL_REGEX_COMBINED.match
+    size = chunk_size
+    text, pos = u'', 0
+    eof = False
+    while not eof:
+        chunk = stream.read(size)
+        eof = not chunk
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(
+                    encoding or 'utf-8')('replace')
+            chunk = decoder.decode(chunk, eof)
+
+        # Keep one character already lexed as context for look-behinds.
+        text = text[max(pos - 1, 0):] + chunk
+        pos = min(pos, 1)
+
+        items = []
+        idx, end = pos, len(text)
+        while idx < end:
+            m = match(text, idx)
+            if not m:
+                ttype, value, nidx = tokens.Error, text[idx], idx + 1
+            else:
+                action = SQL_REGEX_ACTIONS[m.lastgroup]
+                if isinstance(action, tokens._TokenType):
+                    ttype, value = action, m.group()
+                else:
+                    ttype, value = action(m.group())
+                nidx = m.end()
+
+            if not eof and _is_unstable(text, idx, nidx, ttype, value):
+                # Words before it may still turn into a multi-word keyword
+                # (e.g. LEFT OUTER JOIN) or a name followed by a period.
+                words = 0
+                while items and words < 2:
+                    _, ttype, value = items.pop()
+                    words += ttype not in tokens.Whitespace
+                break
+            items.append((idx, ttype, value))
+            idx = nidx
+
+        for _, ttype, value in items:
+            yield ttype, value
+
+        if items:
+            pos = items[-1][0] + len(items[-1][2])
+            size = chunk_size
+        else:
+            # No progress: a single token spans the whole buffer.
+            size *= 2
+
+
+def tokenize(sql, encoding=None, lexer=None):
     """Tokenize sql.
 
     Tokenize *sql* using the :class:`Lexer` and return a 2-tuple stream
-    of ``(token type, value)`` items.
+    of ``(token type, value)`` items. File-like objects are read in chunks
+    using :func:`tokenize_stream`.
+
+    *lexer* selects the lexer class to use, e.g. :class:`CombinedLexer`.
+    Defaults to :class:`Lexer`. A file-like object is read completely
+    if *lexer* is given. Bytes read from it are decoded with *encoding*,
+    UTF-8 by default, replacing undecodable bytes with U+FFFD.
     """
-    return Lexer().get_tokens(sql, encoding)
+    if hasattr(sql, 'read'):
+        if lexer is None:
+            return tokenize_stream(sql, encoding)
+        # Decode the contents like tokenize_stream() does.
+        sql = sql.read()
+        if isinstance(sql, bytes):
+            sql = sql.decode(encoding or 'utf-8', 'replace')
+    lexer = lexer or Lexer
+    return lexer().get_tokens(sql, encoding)
@@ -12,7 +12,31 @@ import re
 
 from sqlparse import tokens as T
 from sqlparse.compat import string_types, text_type, unicode_compatible
-from sqlparse.utils import imt, remove_quotes
+from sqlparse.utils import Matcher, remove_quotes
+
+# Compiled patterns of Token.match(), by values and flags
+_PATTERNS = {}
+_MAXCACHE = 100
+
+
+def _compile_patterns(values, flags):
+    try:
+        return _PATTERNS[values, flags]
+    except KeyError:
+        if len(_PATTERNS) >= _MAXCACHE:
+            _PATTERNS.clear()
+        patterns = _PATTERNS[values, flags] = [
+            re.compile(v, flags) for v in values]
+        return patterns
+
+
+# Matchers of the token_next_by() searches below, see also the end of
+# this module
+_M_ALIAS = Matcher(t=T.Alias)
+_M_PERIOD = Matcher(m=(T.Punctuation, '.'))
+_M_TYPECAST = Matcher(m=(T.Punctuation, '::'))
+_M_WILDCARD = Matcher(t=T.Wildcard)
+_M_ORDER = Matcher(t=T.Keyword.Order)
 
 
 @unicode_compatible
@@ -84,11 +108,8 @@ class Token(object):
             values = (values,)
 
         if regex:
-            # TODO: Add test for regex with is_keyboard = false
             flag = re.IGNORECASE if self.is_keyword else 0
-            values = (re.compile(v, flag) for v in values)
-
-            for pattern in values:
+            for pattern in _compile_patterns(tuple(values), flag):
                 if pattern.search(self.normalized):
                     return True
             return False
@@ -133,13 +154,57 @@ class TokenList(Token):
     list of child-tokens.
     """
 
-    __slots__ = 'tokens'
+    __slots__ = ('tokens', '_value', '_lazy', '_nav')
 
     def __init__(self, tokens=None):
         self.tokens = tokens or []
         [setattr(token, 'parent', self) for token in tokens]
-        super(TokenList, self).__init__(None, text_type(self))
+        # Token.__init__ isn't called, the value is computed on demand.
+        self._value = None
+        self._lazy = None
+        self._nav = None
+        self.ttype = None
+        self.parent = None
         self.is_group = True
+        self.is_keyword = False
+        self.is_whitespace = False
+
+    @property
+    def value(self):
+        """The unchanged value of the group.
+
+        It's computed on first access and cached until the group is
+        modified by one of its methods.
+        """
+        if self._value is None:
+            self._value = text_type(self)
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    @property
+    def normalized(self):
+        return self.value
+
+    @normalized.setter
+    def normalized(self, value):
+        self._value = value
+
+    def _reset_value(self):
+        """Drops the cached value of this group and of all its parents."""
+        tlist = self
+        while tlist is not None:
+            tlist._value = None
+            tlist = tlist.parent
+
+    def __getattr__(self, name):
+        # The tokens of a lazily grouped group are hidden until they're
+        # accessed, see grouping.group().
+        if name == 'tokens' and getattr(self, '_lazy', None) is not None:
+            return self._lazy(self)
+        raise AttributeError(name)
 
     def __str__(self):
         return ''.join(token.value for token in self.flatten())
@@ -180,14 +245,22 @@ class TokenList(Token):
     def flatten(self):
         """Generator yielding ungrouped tokens.
 
-        This method is recursively called for all child tokens.
+        Child groups are flattened in place, using a stack of iterators
+        instead of recursion.
         """
-        for token in self.tokens:
-            if token.is_group:
-                for item in token.flatten():
-                    yield item
-            else:
+        stack = [iter(self._flat_tokens())]
+        while stack:
+            for token in stack[-1]:
+                if token.is_group:
+                    stack.append(iter(token._flat_tokens()))
+                    break
                 yield token
+            else:
+                stack.pop()
+
+    def _flat_tokens(self):
+        # Flattening doesn't need the tokens of a lazy group grouped.
+        return self.tokens if self._lazy is None else self._lazy.tokens(self)
 
     def get_sublists(self):
         for token in self.tokens:
@@ -206,20 +279,114 @@ class TokenList(Token):
         if not isinstance(funcs, (list, tuple)):
             funcs = (funcs,)
 
+        tokens = self.tokens
         if reverse:
             assert end is None
             for idx in range(start - 2, -1, -1):
-                token = self.tokens[idx]
+                token = tokens[idx]
+                for func in funcs:
+                    if func(token):
+                        return idx, token
+        elif start < 0 or (end is not None and end < 0):
+            for idx, token in enumerate(tokens[start:end], start=start):
                 for func in funcs:
                     if func(token):
                         return idx, token
         else:
-            for idx, token in enumerate(self.tokens[start:end], start=start):
+            end = len(tokens) if end is None else min(end, len(tokens))
+            for idx in range(start, end):
+                token = tokens[idx]
                 for func in funcs:
                     if func(token):
                         return idx, token
         return None, None
 
+    def _indexes(self):
+        """Returns a dict caching indexes of the tokens.
+
+        The indexes are dropped when the tokens are changed by the methods
+        of this class, another list is assigned or the length of the list
+        changes. ``None`` is returned on the first call after a change,
+        indexes are only worth building for tokens that are looked up more
+        than once. Tokens replaced in place are found by checking the
+        results, see :meth:`_token_skipping`.
+        """
+        tokens = self.tokens
+        nav = self._nav
+        if nav is None or nav[0] is not tokens or nav[1] != len(tokens):
+            self._nav = tokens, len(tokens), {}
+            return None
+        return nav[2]
+
+    def _navigation(self, skip_ws, skip_cm):
+        """Returns the index for skipping whitespace and/or comments.
+
+        It's a triple of lists: ``next[idx]`` is the position of the first
+        token at or after *idx* that isn't skipped (``len(tokens)`` if
+        there's none), ``prev[idx]`` the last one at or before *idx*
+        (``-1`` if there's none), followed by a copy of the tokens the
+        index was built for.
+        """
+        indexes = self._indexes()
+        if indexes is None:
+            return None
+        try:
+            return indexes[skip_ws, skip_cm]
+        except KeyError:
+            pass
+        tokens = self.tokens
+        if 'tokens' not in indexes:
+            indexes['tokens'] = list(tokens)
+
+        size = len(tokens)
+        nexts, prevs = [size] * (size + 1), [-1] * size
+        pos = -1
+        for idx, token in enumerate(tokens):
+            if not ((skip_ws and token.is_whitespace) or
+                    (skip_cm and token.ttype in T.Comment)):
+                pos = idx
+            prevs[idx] = pos
+        pos = size
+        for idx in range(size - 1, -1, -1):
+            if prevs[idx] == idx:
+                pos = idx
+            nexts[idx] = pos
+        indexes[skip_ws, skip_cm] = nexts, prevs, indexes['tokens']
+        return indexes[skip_ws, skip_cm]
+
+    def _token_skipping(self, idx, skip_ws, skip_cm, reverse=False):
+        """Returns the next token at or after *idx* that isn't skipped.
+
+        With *reverse* it's the previous token at or before *idx*.
+        """
+        tokens = self.tokens
+        if not (skip_ws or skip_cm):
+            return idx, tokens[idx]
+
+        pos = None
+        nav = self._navigation(skip_ws, skip_cm)
+        if nav is not None:
+            nexts, prevs, indexed = nav
+            pos = prevs[idx] if reverse else nexts[idx]
+            # Tokens may have been replaced in place, check both ends.
+            size = len(tokens)
+            if ((idx < size and tokens[idx] is not indexed[idx]) or
+                    (0 <= pos < size and tokens[pos] is not indexed[pos])):
+                self._nav = pos = None
+        if pos is not None:
+            idx = pos
+        else:
+            step = -1 if reverse else 1
+            while 0 <= idx < len(tokens):
+                token = tokens[idx]
+                if not ((skip_ws and token.is_whitespace) or
+                        (skip_cm and token.ttype in T.Comment)):
+                    break
+                idx += step
+        if 0 <= idx < len(tokens):
+            return idx, tokens[idx]
+        return None, None
+
     def token_first(self, skip_ws=True, skip_cm=False):
         """Returns the first child token.
 
@@ -229,15 +396,15 @@ class TokenList(Token):
         if *skip_cm* is ``True`` (default: ``False``), comments are
         ignored too.
         """
-        # this on is inconsistent, using Comment instead of T.Comment...
-        funcs = lambda tk: not ((skip_ws and tk.is_whitespace) or
-                                (skip_cm and imt(tk, t=T.Comment)))
-        return self._token_matching(funcs)[1]
+        if not self.tokens:
+            return None
+        return self._token_skipping(0, skip_ws, skip_cm)[1]
 
     def token_next_by(self, i=None, m=None, t=None, idx=-1, end=None):
-        funcs = lambda tk: imt(tk, i, m, t)
+        # m may be a Matcher compiled in advance
+        matcher = m if isinstance(m, Matcher) else Matcher(i, m, t)
         idx += 1
-        return self._token_matching(funcs, idx, end)
+        return self._token_matching(matcher, idx, end)
 
     def token_matching(self, funcs, idx):
         return self._token_matching(funcs, idx)[1]
@@ -250,10 +417,12 @@ class TokenList(Token):
         """
         if idx is None:
             return None, None
-        idx += 1  # alot of code usage current pre-compensates for this
-        funcs = lambda tk: not ((skip_ws and tk.is_whitespace) or
-                                (skip_cm and imt(tk, t=T.Comment)))
-        return self._token_matching(funcs, idx, reverse=True)
+        if not 0 < idx <= len(self.tokens):
+            # out of range, keep the behaviour of a plain search
+            funcs = lambda tk: not ((skip_ws and tk.is_whitespace) or
+                                    (skip_cm and tk.ttype in T.Comment))
+            return self._token_matching(funcs, idx + 1, reverse=True)
+        return self._token_skipping(idx - 1, skip_ws, skip_cm, reverse=True)
 
     def token_next(self, idx, skip_ws=True, skip_cm=False):
         """Returns the next token relative to *idx*.
@@ -264,14 +433,34 @@ class TokenList(Token):
         if idx is None:
             return None, None
         idx += 1  # alot of code usage current pre-compensates for this
-        funcs = lambda tk: not ((skip_ws and tk.is_whitespace) or
-                                (skip_cm and imt(tk, t=T.Comment)))
-        return self._token_matching(funcs, idx)
+        if not 0 <= idx < len(self.tokens):
+            # out of range, keep the behaviour of a plain search
+            funcs = lambda tk: not ((skip_ws and tk.is_whitespace) or
+                                    (skip_cm and tk.ttype in T.Comment))
+            return self._token_matching(funcs, idx)
+        return self._token_skipping(idx, skip_ws, skip_cm)
 
     def token_index(self, token, start=0):
         """Return list index of token."""
         start = start if isinstance(start, int) else self.token_index(start)
-        return start + self.tokens[start:].index(token)
+        tokens = self.tokens
+        if start < 0:
+            return start + tokens[start:].index(token)
+
+        indexes = self._indexes()
+        if indexes is not None:
+            try:
+                positions = indexes['positions']
+            except KeyError:
+                # the first position of each token
+                positions = indexes['positions'] = dict(
+                    (id(token), idx) for idx, token in
+                    reversed(list(enumerate(tokens))))
+            idx = positions.get(id(token))
+            # Tokens may have been replaced without changing the length.
+            if idx is not None and idx >= start and tokens[idx] is token:
+                return idx
+        return tokens.index(token, start)
 
     def group_tokens(self, grp_cls, start, end, include_end=True,
                      extend=False):
@@ -290,12 +479,14 @@ class TokenList(Token):
             grp = start
             grp.tokens.extend(subtokens)
             del self.tokens[start_idx + 1:end_idx]
-            grp.value = text_type(start)
+            grp._value = None
         else:
             subtokens = self.tokens[start_idx:end_idx]
             grp = grp_cls(subtokens)
             self.tokens[start_idx:end_idx] = [grp]
             grp.parent = self
+        # A single token may have been replaced, keeping the length.
+        self._nav = None
 
         for token in subtokens:
             token.parent = grp
@@ -308,6 +499,8 @@ class TokenList(Token):
             where = self.token_index(where)
         token.parent = self
         self.tokens.insert(where, token)
+        self._nav = None
+        self._reset_value()
 
     def insert_after(self, where, token, skip_ws=True):
         """Inserts *token* after *where*."""
@@ -319,6 +512,8 @@ class TokenList(Token):
             self.tokens.append(token)
         else:
             self.tokens.insert(nidx, token)
+        self._nav = None
+        self._reset_value()
 
     def has_alias(self):
         """Returns ``True`` if an alias is present."""
@@ -326,7 +521,7 @@ class TokenList(Token):
 
     def get_alias(self):
         """Returns the alias for this identifier or ``None``."""
-        _, alias = self.token_next_by(t=T.Alias)
+        _, alias = self.token_next_by(m=_M_ALIAS)
         return remove_quotes(alias.value) if alias is not None else None
 
     def get_name(self):
@@ -341,7 +536,7 @@ class TokenList(Token):
     def get_real_name(self):
         """Returns the real name (object name) of this identifier."""
         # a.b
-        dot_idx, _ = self.token_next_by(m=(T.Punctuation, '.'))
+        dot_idx, _ = self.token_next_by(m=_M_PERIOD)
         return self._get_first_name(dot_idx)
 
     def get_parent_name(self):
@@ -349,7 +544,7 @@ class TokenList(Token):
 
         A parent object is identified by the first occuring dot.
         """
-        dot_idx, _ = self.token_next_by(m=(T.Punctuation, '.'))
+        dot_idx, _ = self.token_next_by(m=_M_PERIOD)
         _, prev_ = self.token_prev(dot_idx)
         return remove_quotes(prev_.value) if prev_ is not None else None
 
@@ -370,6 +565,8 @@ class TokenList(Token):
 class Statement(TokenList):
     """Represents a SQL statement."""
 
+    __slots__ = ()
+
     def get_type(self):
         """Returns the type of a statement.
 
@@ -411,20 +608,22 @@ class Identifier(TokenList):
     Identifiers may have aliases or typecasts.
     """
 
+    __slots__ = ()
+
     def is_wildcard(self):
         """Return ``True`` if this identifier contains a wildcard."""
-        _, token = self.token_next_by(t=T.Wildcard)
+        _, token = self.token_next_by(m=_M_WILDCARD)
         return token is not None
 
     def get_typecast(self):
         """Returns the typecast or ``None`` of this object as a string."""
-        midx, marker = self.token_next_by(m=(T.Punctuation, '::'))
+        midx, marker = self.token_next_by(m=_M_TYPECAST)
         nidx, next_ = self.token_next(midx, skip_ws=False)
         return next_.value if next_ else None
 
     def get_ordering(self):
         """Returns the ordering or ``None`` as uppercase string."""
-        _, ordering = self.token_next_by(t=T.Keyword.Order)
+        _, ordering = self.token_next_by(m=_M_ORDER)
         return ordering.normalized if ordering else None
 
     def get_array_indices(self):
@@ -439,6 +638,8 @@ class Identifier(TokenList):
 class IdentifierList(TokenList):
     """A list of :class:`~sqlparse.sql.Identifier`\'s."""
 
+    __slots__ = ()
+
     def get_identifiers(self):
         """Returns the identifiers.
 
@@ -451,6 +652,7 @@ class IdentifierList(TokenList):
 
 class Parenthesis(TokenList):
     """Tokens between parenthesis."""
+    __slots__ = ()
     M_OPEN = T.Punctuation, '('
     M_CLOSE = T.Punctuation, ')'
 
@@ -459,11 +661,12 @@ class Parenthesis(TokenList):
         return self.tokens[1:-1]
 
     def is_subquery(self):
-        return self.token_next_by(i=Select) is not None
+        return self.token_next_by(m=_M_SELECT) is not None
 
 
 class SquareBrackets(TokenList):
     """Tokens between square brackets"""
+    __slots__ = ()
     M_OPEN = T.Punctuation, '['
     M_CLOSE = T.Punctuation, ']'
 
@@ -475,15 +678,19 @@ class SquareBrackets(TokenList):
 class Assignment(TokenList):
     """An assignment like 'var := val;'"""
 
+    __slots__ = ()
+
 
 class If(TokenList):
     """An 'if' clause with possible 'else if' or 'else' parts."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'IF'
     M_CLOSE = T.Keyword, 'END IF'
 
 
 class For(TokenList):
     """A 'FOR' loop."""
+    __slots__ = ()
     M_OPEN = T.Keyword, ('FOR', 'FOREACH')
     M_CLOSE = T.Keyword, 'END LOOP'
 
@@ -491,6 +698,8 @@ class For(TokenList):
 class Comparison(TokenList):
     """A comparison used for example in WHERE clauses."""
 
+    __slots__ = ()
+
     @property
     def left(self):
         return self.tokens[0]
@@ -502,6 +711,7 @@ class Comparison(TokenList):
 
 class Case(TokenList):
     """A CASE statement with one or more WHEN and possibly an ELSE part."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'CASE'
     M_CLOSE = T.Keyword, 'END'
 
@@ -556,19 +766,22 @@ class Case(TokenList):
 class Function(TokenList):
     """A function or procedure call."""
 
+    __slots__ = ()
+
     def get_parameters(self):
         """Return a list of parameters."""
         parenthesis = self.tokens[-1]
         for token in parenthesis.tokens:
             if isinstance(token, IdentifierList):
                 return token.get_identifiers()
-            elif imt(token, i=(Function, Identifier), t=T.Literal):
+            elif _M_PARAMETER(token):
                 return [token, ]
         return []
 
 
 class Begin(TokenList):
     """A BEGIN/END block."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'BEGIN'
     M_CLOSE = T.Keyword, 'END'
 
@@ -576,23 +789,29 @@ class Begin(TokenList):
 class Operation(TokenList):
     """Grouping of operations"""
 
+    __slots__ = ()
+
 
 class CTE(TokenList):
+    __slots__ = ()
     M_OPEN = T.CTE, 'WITH'
     M_CLOSE = T.Keyword.DML, 'SELECT'
 
 
 class CTE_Subquery(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword.Join, None
     M_CLOSE = [(T.Keyword.Join, None), (T.Punctuation, ',')]
 
 
 class Select(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword.DML, 'SELECT'
     M_CLOSE = T.Keyword, 'FROM'
 
 
 class From(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword, 'FROM'
     M_CLOSE = T.Keyword, ('UNION', 'EXCEPT', 'MINUS', 'INTERSECT', 'LIMIT',
                           'ORDER', 'HAVING', 'GROUP', 'CONNECT', 'WHERE')
@@ -600,30 +819,35 @@ class From(TokenList):
 
 class Where(TokenList):
     """A WHERE clause."""
+    __slots__ = ()
     M_OPEN = T.Keyword, 'WHERE'
     M_CLOSE = T.Keyword, ('UNION', 'EXCEPT', 'MINUS', 'INTERSECT', 'LIMIT',
                           'ORDER', 'HAVING', 'GROUP', 'CONNECT', 'RETURNING')
 
 
 class Connect(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword, 'CONNECT'
     M_CLOSE = T.Keyword, ('UNION', 'EXCEPT', 'MINUS', 'INTERSECT', 'LIMIT',
                           'ORDER', 'HAVING', 'GROUP')
 
 
 class Group(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword, 'GROUP'
     M_CLOSE = T.Keyword, ('UNION', 'EXCEPT', 'MINUS', 'INTERSECT', 'LIMIT',
                           'ORDER', 'HAVING')
 
 
 class Having(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword, 'HAVING'
     M_CLOSE = T.Keyword, ('UNION', 'EXCEPT', 'MINUS', 'INTERSECT', 'LIMIT',
                           'ORDER')
 
 
 class Order(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword, 'ORDER'
     M_CLOSE = T.Keyword, ('UNION', 'EXCEPT', 'MINUS', 'INTERSECT', 'LIMIT')
 
@@ -635,25 +859,36 @@ class Order(TokenList):
 
 
 class ComparisonList(TokenList):
+    __slots__ = ()
     M_SEPARATOR = T.Keyword, ('AND', 'OR')
 
     def get_comparisons(self):
         for token in self.tokens:
-            if not (token.is_whitespace or imt(token, m=self.M_SEPARATOR)):
+            if not (token.is_whitespace or _M_SEPARATOR(token)):
                 yield token
 
 
 class Join_Clause(TokenList):
+    __slots__ = ()
     M_OPEN = T.Keyword.Join, None
     M_CLOSE = [(T.Keyword.Join, None), (T.Punctuation, ',')]
 
 
 class Subquery(TokenList):
+    __slots__ = ()
+
     @property
     def _groupable_tokens(self):
         return self.tokens[1:-1]
 
 
 class Table_Group(TokenList):
+    __slots__ = ()
     M_OPEN = T.Name, None
     M_CLOSE = T.Punctuation, ','
+
+
+# Matchers referring to the classes above
+_M_SELECT = Matcher(i=Select)
+_M_PARAMETER = Matcher(i=(Function, Identifier), t=T.Literal)
+_M_SEPARATOR = Matcher(m=ComparisonList.M_SEPARATOR)
@@ -11,19 +11,47 @@
 
 """Tokens"""
 
+import itertools
+import threading
+
 import sqlparse.sql
 
+_TYPE_IDS = itertools.count()
+_LOCK = threading.Lock()
+
 
 class _TokenType(tuple):
     parent = None
 
+    def __init__(self, *args):
+        # Each token type gets a unique integer id and the set of the ids
+        # of itself and all its ancestors, so that subtype checks are a
+        # single set lookup.
+        self._id = next(_TYPE_IDS)
+        self._ancestors = frozenset((self._id,))
+
     def __contains__(self, item):
-        return item is not None and (self is item or item[:len(self)] == self)
+        if item is None:
+            return False
+        try:
+            return self._id in item._ancestors
+        except AttributeError:  # a plain tuple
+            return item[:len(self)] == self
 
     def __getattr__(self, name):
-        new = _TokenType(self + (name,))
-        setattr(self, name, new)
-        new.parent = self
+        if name.startswith('__'):
+            raise AttributeError(name)
+        # The types used by sqlparse are created on import. Other types
+        # are created on first access, maybe by several threads at once.
+        with _LOCK:
+            try:
+                return self.__dict__[name]
+            except KeyError:
+                pass
+            new = _TokenType(self + (name,))
+            new.parent = self
+            new._ancestors = self._ancestors | new._ancestors
+            setattr(self, name, new)
         return new
 
     def __repr__(self):
@@ -72,3 +100,13 @@ DML = Keyword.DML
 DDL = Keyword.DDL
 CTE = Keyword.CTE
 Command = Keyword.Command
+
+# Subtypes used by the lexer and the grouping engine, all types are
+# created before any statement is parsed.
+_SUBTYPES = (
+    Comment.Single.Hint, Comment.Multiline.Code, Comment.Multiline.Hint,
+    Keyword.Join, Keyword.Order,
+    Name.Builtin, Name.Placeholder,
+    Number.Float, Number.Hexadecimal, Number.Integer,
+    String.Single, String.Symbol,
+)
@@ -5,11 +5,15 @@
 # This module is part of python-sqlparse and is released under
 # the BSD License: http://www.opensource.org/licenses/bsd-license.php
 
+import io
 import itertools
+import mmap
+import os
 import re
 from collections import deque
 from contextlib import contextmanager
-from sqlparse.compat import text_type
+from sqlparse import tokens as T
+from sqlparse.compat import string_types, text_type
 
 # This regular expression replaces the home-cooked parser that was here before.
 # It is much faster, but requires an extra post-processing step to get the
@@ -41,14 +45,17 @@ def split_unquoted_newlines(stmt):
     character is inside of a string."""
     text = text_type(stmt)
     lines = SPLIT_REGEX.split(text)
-    outputlines = ['']
+    outputlines = []
+    parts = []
     for line in lines:
         if not line:
             continue
         elif LINE_MATCH.match(line):
-            outputlines.append('')
+            outputlines.append(u''.join(parts))
+            parts = []
         else:
-            outputlines[-1] += line
+            parts.append(line)
+    outputlines.append(u''.join(parts))
     return outputlines
 
 
@@ -67,6 +74,7 @@ def imt(token, i=None, m=None, t=None):
     :param t: TokenType or Tuple/List of TokenTypes
     :return:  bool
     """
+    # Compiling a Matcher only pays off for many tokens.
     clss = i
     types = [t, ] if t and not isinstance(t, list) else t
     mpatterns = [m, ] if m and not isinstance(m, list) else m
@@ -83,6 +91,190 @@ def imt(token, i=None, m=None, t=None):
         return False
 
 
+class Matcher(object):
+    """Compiled arguments of :func:`imt`.
+
+    Calling a matcher with a token returns ``imt(token, i, m, t)``.
+    Create it once and use it for many tokens.
+    """
+
+    __slots__ = ('classes', 'types', 'subtypes', 'patterns')
+
+    def __init__(self, i=None, m=None, t=None):
+        self.classes = tuple(i) if isinstance(i, list) else i or ()
+
+        # A single token type matches its subtypes, a tuple of token types
+        # only matches the types in it.
+        types, subtypes = set(), set()
+        for ttype in ([t] if t and not isinstance(t, list) else t or ()):
+            if isinstance(ttype, T._TokenType):
+                subtypes.add(ttype._id)
+            else:
+                types.update(ttype)
+        self.types = frozenset(types)
+        self.subtypes = frozenset(subtypes)
+
+        self.patterns = [self._compile(*pattern) for pattern in
+                         ([m] if m and not isinstance(m, list) else m or ())]
+
+    @staticmethod
+    def _compile(ttype, values, regex=False):
+        # Compiles the arguments of Token.match()
+        if not isinstance(ttype, T._TokenType):
+            ttype = frozenset(ttype)
+        if values is None:
+            return ttype, None, None
+        if isinstance(values, string_types):
+            values = (values,)
+        if regex:
+            return ttype, [re.compile(v) for v in values], [
+                re.compile(v, re.IGNORECASE) for v in values]
+        return ttype, frozenset(values), frozenset(v.upper() for v in values)
+
+    def __call__(self, token):
+        if token is None:
+            return False
+        ttype = token.ttype
+        if ttype in self.types:
+            return True
+        if (self.subtypes and ttype is not None and
+                not self.subtypes.isdisjoint(ttype._ancestors)):
+            return True
+        if isinstance(token, self.classes):
+            return True
+
+        for match_type, values, keyword_values in self.patterns:
+            if ttype not in match_type:
+                continue
+            if values is None:
+                return True
+            if token.is_keyword:
+                values = keyword_values
+            if isinstance(values, frozenset):
+                if token.normalized in values:
+                    return True
+            elif any(pattern.search(token.normalized) for pattern in values):
+                return True
+        return False
+
+
+# The characters str.splitlines() breaks lines at
+LINE_BREAKS = u'\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+LAST_LINE_BREAK = re.compile(u'.*[{0}]'.format(LINE_BREAKS), re.DOTALL)
+
+
+class LineTracker(object):
+    """Measures the line in front of the tokens of a statement.
+
+    The text is followed back from a token to the previous line break
+    and the lengths found on the way are remembered. :meth:`changed` has
+    to be called whenever tokens are inserted into or removed from the
+    statement.
+    """
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+        # leaf -> length of the last line of the text up to its end
+        self._tails = {}
+
+    def changed(self):
+        self._tails.clear()
+
+    def column(self, token):
+        """Returns ``len(text.splitlines()[-1])`` of the text in front of
+        *token* or ``0`` if there's no text.
+        """
+        if token.is_group:
+            token = next(token.flatten())
+        leaves = self._leaves_before(token)
+        if leaves is None:
+            return self._column_flat(token)
+
+        leaves = (leaf for leaf in leaves if leaf.value)
+        last = next(leaves, None)
+        if last is None:
+            return 0
+        value = last.value
+        if value[-1] not in LINE_BREAKS:
+            if last not in self._tails:
+                self._tails[last] = self._count(value, leaves)
+            return self._tails[last]
+
+        # Like str.splitlines() does, don't start a line after the final
+        # line break. A '\r\n' may be split over two leaves.
+        self._tails[last] = 0
+        value = value[:-1]
+        if last.value[-1] == '\n':
+            if not value:
+                last = next(leaves, None)
+                if last is None:
+                    return 0
+                value = last.value
+            if value[-1] == '\r':
+                value = value[:-1]
+        return self._count(value, leaves)
+
+    def _count(self, value, leaves):
+        length = 0
+        while True:
+            match = LAST_LINE_BREAK.match(value)
+            if match:
+                return length + len(value) - match.end()
+            length += len(value)
+            leaf = next(leaves, None)
+            if leaf is None:
+                return length
+            if leaf in self._tails:
+                return length + self._tails[leaf]
+            value = leaf.value
+
+    def _leaves_before(self, token):
+        """Returns a reversed iterator over the leaves in front of *token*.
+
+        ``None`` is returned if *token* can't be found from the statement
+        by its parents.
+        """
+        path = []
+        while token is not self.stmt:
+            parent = token.parent
+            if parent is None:
+                return None
+            try:
+                path.append((parent, parent.token_index(token)))
+            except ValueError:
+                return None
+            token = parent
+        return self._reversed_leaves(path)
+
+    @staticmethod
+    def _reversed_leaves(path):
+        for parent, idx in path:
+            tokens = parent.tokens
+            while idx > 0:
+                idx -= 1
+                token = tokens[idx]
+                if not token.is_group:
+                    yield token
+                    continue
+                stack = [reversed(token.tokens)]
+                while stack:
+                    for child in stack[-1]:
+                        if child.is_group:
+                            stack.append(reversed(child.tokens))
+                            break
+                        yield child
+                    else:
+                        stack.pop()
+
+    def _column_flat(self, token):
+        raw = []
+        for leaf in self.stmt.flatten():
+            if leaf is token:
+                break
+            raw.append(leaf.value)
+        return len((''.join(raw) or '\n').splitlines()[-1])
+
+
 def consume(iterator, n):
     """Advance the iterator n-steps ahead. If n is none, consume entirely."""
     deque(itertools.islice(iterator, n), maxlen=0)
@@ -100,3 +292,22 @@ def indent(filter_, n=1):
     filter_.indent += n
     yield
     filter_.indent -= n
+
+
+@contextmanager
+def mapped_file(path):
+    """Memory-maps the file at *path* read-only.
+
+    Yields a file-like object reading from the mapped buffer.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses to map empty files
+            yield io.BytesIO()
+            return
+
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buf
+        finally:
+            buf.close()
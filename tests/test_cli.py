@@ -73,3 +73,18 @@ def test_script():
     # Call with the --help option as a basic sanity check.
     cmd = "{0:s} -m sqlparse.cli --help".format(sys.executable)
     assert subprocess.call(cmd.split()) == 0
+
+
+def test_split(filepath, load_file, capsys):
+    path = filepath('begintag.sql')
+    sqlparse.cli.main([path, '--split', '-j', '2'])
+    out, _ = capsys.readouterr()
+    stmts = sqlparse.split(load_file('begintag.sql'))
+    assert out == ''.join(stmt + '\n\n' for stmt in stmts)
+
+
+def test_split_invalid_infile(filepath, capsys):
+    path = filepath('missing.sql')
+    sqlparse.cli.main([path, '--split'])
+    _, err = capsys.readouterr()
+    assert err[:22] == "[ERROR] Failed to read"
@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import random
+import sys
+from multiprocessing.pool import ThreadPool
+
 import pytest
 
 import sqlparse
+from sqlparse import filters
+from sqlparse.compat import StringIO
 from sqlparse.exceptions import SQLParseError
 
 
@@ -80,6 +86,28 @@ class TestFormat(object):
         s = 'select -- foo\nfrom    bar\n'
         assert f(s) == 'select -- foo\nfrom bar'
 
+    def test_strip_ws_deeply_nested(self):
+        depth = sys.getrecursionlimit() * 2
+        s = 'select {0} 1 {1}'.format('( ' * depth, ' )' * depth)
+        res = sqlparse.format(s, strip_whitespace=True)
+        assert res == 'select {0}1{1}'.format('(' * depth, ')' * depth)
+
+    def test_strip_ws_padded(self):
+        f = lambda sql: sqlparse.format(sql, strip_whitespace=True)
+        s = 'select a\n, b\n,c from (\n\n  select 1\n\n) \n\n x'
+        assert f(s) == 'select a, b,c from (select 1) x'
+
+    @pytest.mark.parametrize('filter_', [
+        filters.StripWhitespaceFilter, filters.ReindentFilter,
+        filters.AlignedIndentFilter, filters.SpacesAroundOperatorsFilter])
+    def test_group_values_after_filter(self, filter_):
+        # the cached values of the changed groups are dropped
+        p = sqlparse.parse('select a  ,   b+1 from (  c  ) where x  =1')[0]
+        groups = [p] + [t for t in p.tokens if t.is_group]
+        [t.value for t in groups]
+        filter_().process(p)
+        assert [t.value for t in groups] == [str(t) for t in groups]
+
     def test_strip_ws_invalid_option(self):
         s = 'select -- foo\nfrom    bar\n'
         with pytest.raises(SQLParseError):
@@ -282,6 +310,14 @@ class TestFormatReindentAligned(object):
             '(PARTITION BY b, c ORDER BY d DESC) as row_num',
             '  from table'])
 
+    def test_identifier_list_first(self):
+        # Used to raise an IndexError looking for the line in front of "a".
+        sql = 'a, b from table'
+        assert self.formatter(sql) == '\n'.join([
+            'a,',
+            'b',
+            '  from table'])
+
 
 class TestSpacesAroundOperators(object):
     @staticmethod
@@ -309,6 +345,16 @@ class TestSpacesAroundOperators(object):
         sql = 'select a*b-c from table'
         assert self.formatter(sql) == 'select a * b - c from table'
 
+    def test_linebreaks(self):
+        sql = 'select a+\nb, c -\n  d from table'
+        assert self.formatter(sql) == 'select a +\n b, c -\n   d from table'
+
+    def test_deeply_nested(self):
+        n = sys.getrecursionlimit() * 2
+        sql = 'select {0}'.format('+'.join(['a'] * n))
+        assert self.formatter(sql) == 'select {0}'.format(
+            ' + '.join(['a'] * n))
+
 
 class TestFormatReindent(object):
     def test_option(self):
@@ -511,6 +557,31 @@ class TestFormatReindent(object):
             '       nvl(1)',
             'from dual'])
 
+    def test_nested_offsets(self):
+        f = lambda sql: sqlparse.format(sql, reindent=True)
+        s = ('select a, case when b = 1 then (select c, d from t) '
+             'else e end as f, g from h')
+        assert f(s) == '\n'.join([
+            'select a,',
+            '       case',
+            '           when b = 1 then',
+            '                  (select c,',
+            '                          d',
+            '                   from t)',
+            '           else e',
+            '       end as f,',
+            '       g',
+            'from h'])
+        s = 'select a, b from t\r\nwhere c in (select d, e from u)'
+        assert f(s) == '\n'.join([
+            'select a,',
+            '       b',
+            'from t',
+            'where c in',
+            '    (select d,',
+            '            e',
+            '     from u)'])
+
 
 class TestOutputFormat(object):
     def test_python(self):
@@ -523,6 +594,22 @@ class TestOutputFormat(object):
             "sql = ('select * '",
             "       'from foo;')"])
 
+    def test_python_reindent_groups(self):
+        # The line breaks inserted into groups have to end up outside of
+        # the string literals.
+        sql = "select a, b from foo where c = 1 and d = 'x'"
+        res = sqlparse.format(sql, output_format='python', reindent=True)
+        assert res == '\n'.join([
+            "sql = ('select a,  '",
+            "       '       b '",
+            "       'from foo  '",
+            "       'where c = 1 '",
+            "       '  and d = \\'x\\'')"])
+        namespace = {}
+        exec(compile(res, '<sql>', 'exec'), namespace)
+        assert namespace['sql'] == (
+            "select a,         b from foo  where c = 1   and d = 'x'")
+
     def test_python_multiple_statements(self):
         sql = 'select * from foo; select 1 from dual'
         f = lambda sql: sqlparse.format(sql, output_format='python')
@@ -551,6 +638,15 @@ class TestOutputFormat(object):
             '$sql  = "select * ";',
             '$sql .= "from foo;";'])
 
+    def test_php_reindent_groups(self):
+        sql = 'select a, b from foo where c = "x"'
+        res = sqlparse.format(sql, output_format='php', reindent=True)
+        assert res == '\n'.join([
+            '$sql  = "select a,  ";',
+            '$sql .= "       b ";',
+            '$sql .= "from foo  ";',
+            '$sql .= "where c = \\"x\\"";'])
+
     def test_sql(self):
         # "sql" is an allowed option but has no effect
         sql = 'select * from foo;'
@@ -611,6 +707,71 @@ def test_having_produces_newline():
     assert formatted == '\n'.join(expected)
 
 
+def test_formatter():
+    sql = 'select a, b from foo; select 1'
+    f = sqlparse.Formatter(output_format='python')
+    expected = "sql = 'select a, b from foo; '\nsql2 = 'select 1'"
+    # the filters start over for each call
+    assert f.format(sql) == expected
+    assert f.format(sql) == expected
+
+    f = sqlparse.Formatter(reindent=True)
+    expected = 'select a,\n       b\nfrom foo;\n\nselect 1'
+    assert f.format(sql) == expected
+    assert f.format(sql) == expected
+    stmts = list(f.format_stream(StringIO(sql)))
+    assert stmts == ['select a,\n       b\nfrom foo;', '\n\nselect 1']
+
+
+def test_format_to():
+    sql = "select a, b  \nfrom foo; select 'x  \n  ' from bar"
+    expected = sqlparse.format(sql, reindent=True)
+    out = StringIO()
+    sqlparse.format_to(out, sql, reindent=True)
+    assert out.getvalue() == expected
+    out = StringIO()
+    sqlparse.format_to(out, StringIO(sql), reindent=True)
+    assert out.getvalue() == expected
+
+    f = sqlparse.Formatter(output_format='python')
+    out = StringIO()
+    f.format_to(out, sql)
+    f.format_to(out, sql)
+    assert out.getvalue() == f.format(sql) * 2
+
+
+def test_formatter_invalid_option():
+    with pytest.raises(SQLParseError):
+        sqlparse.Formatter(keyword_case='foo')
+
+
+def test_formatter_threads(load_file):
+    # Formatters are shared by the threads, each thread formats the files
+    # in its own order.
+    options = [dict(reindent=True), dict(reindent_aligned=True),
+               dict(reindent=True, output_format='python'),
+               dict(use_space_around_operators=True, keyword_case='upper'),
+               dict(strip_comments=True, output_format='php')]
+    formatters = [sqlparse.Formatter(**opts) for opts in options]
+    texts = [load_file(name) for name in ('begintag.sql', 'function.sql',
+                                          'function_psql.sql')]
+    jobs = [(f, text) for f in formatters for text in texts]
+    expected = dict(((id(f), text), sqlparse.format(text, **f.options))
+                    for f, text in jobs)
+
+    def run(seed):
+        order = list(jobs) * 2
+        random.Random(seed).shuffle(order)
+        return all(f.format(text) == expected[id(f), text]
+                   for f, text in order)
+
+    pool = ThreadPool(8)
+    try:
+        assert all(pool.map(run, range(8)))
+    finally:
+        pool.close()
+
+
 @pytest.mark.parametrize('right_margin', ['ten', 2])
 def test_format_right_margin_invalid_option(right_margin):
     with pytest.raises(SQLParseError):
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import sys
+
 import pytest
 
 import sqlparse
 from sqlparse import sql, tokens as T
+from sqlparse.compat import StringIO
+from sqlparse.engine import grouping
 
 
 def test_grouping_parenthesis():
@@ -493,3 +497,117 @@ def test_aliased_literal_without_as():
     p = sqlparse.parse('1 foo')[0].tokens
     assert len(p) == 1
     assert p[0].get_alias() == 'foo'
+
+
+def _ungrouped(s):
+    stmt = sqlparse.parse(s)[0]
+    return sql.Statement(list(stmt.flatten()))
+
+
+def _tree(stmt):
+    f = StringIO()
+    stmt._pprint_tree(f=f)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize('s', [
+    'select (select (x3) x2) and (y2) bar',
+    'select a.b[1] as c, case when x = 1 then (y) end z from t '
+    'where a.b::int > 1 order by 1 desc',
+    'begin if x then case when a then b end; end if; end',
+    'select substring(a from 1 for 2) from t',
+    '( [ ) ] end )',
+    'case begin end end',
+    'foo := 1; bar(x, y) as z',
+])
+def test_grouping_single_walk(s):
+    funcs = [grouping.group_brackets, grouping.group_parenthesis,
+             grouping.group_case, grouping.group_if, grouping.group_for,
+             grouping.group_begin, grouping.group_functions,
+             grouping.group_where, grouping.group_period,
+             grouping.group_arrays, grouping.group_identifier,
+             grouping.group_operator, grouping.group_order,
+             grouping.group_typecasts, grouping.group_as,
+             grouping.group_aliased, grouping.group_assignment,
+             grouping.group_comparison, grouping.group_identifier_list]
+    expected = _ungrouped(s)
+    for func in funcs:
+        func(expected)
+    assert _tree(grouping.group(_ungrouped(s))) == _tree(expected)
+    assert _tree(grouping.group(_ungrouped(s), lazy=True)) == _tree(expected)
+
+
+def test_grouping_deeply_nested():
+    depth = sys.getrecursionlimit() * 2
+    s = 'select {0}a.b as c{1} from t'.format('(' * depth, ')' * depth)
+
+    def innermost(stmt):
+        token = stmt.tokens[2]
+        for _ in range(depth):
+            assert isinstance(token, sql.Parenthesis)
+            token = token.tokens[1]
+        return token
+
+    stmt = sqlparse.parse(s)[0]
+    assert str(stmt) == s
+    assert innermost(stmt).get_alias() == 'c'
+
+    # grouping functions called on their own don't recurse either
+    stmt = _ungrouped(s)
+    grouping.group_parenthesis(stmt)
+    grouping.group_period(stmt)
+    assert isinstance(innermost(stmt), sql.Identifier)
+
+
+def test_grouping_lazy():
+    s = 'select (select (x) as y from t) z from u where a in (1, 2)'
+    stmt = sqlparse.parse(s, lazy=True)[0]
+    assert str(stmt) == s
+    assert stmt.get_type() == 'SELECT'
+    ident = stmt.tokens[2]
+    assert isinstance(ident, sql.Identifier)
+    assert ident._lazy is not None
+    # only the accessed subtree is grouped
+    subquery = ident.tokens[0]
+    assert ident._lazy is None
+    assert subquery._lazy is not None
+    assert isinstance(subquery.tokens[3], sql.Identifier)
+    assert stmt.tokens[-1]._lazy is not None
+    assert _tree(stmt) == _tree(sqlparse.parse(s)[0])
+
+
+def test_grouping_matching():
+    stmt = _ungrouped('select (a[1]) from t where (case x when 1 then 2 end)')
+    grouping.group_matching(stmt)
+    assert isinstance(stmt.tokens[2], sql.Parenthesis)
+    assert isinstance(stmt.tokens[2].tokens[2], sql.SquareBrackets)
+    assert isinstance(stmt.tokens[-1], sql.Parenthesis)
+    assert isinstance(stmt.tokens[-1].tokens[1], sql.Case)
+
+
+@pytest.mark.parametrize('s, expected', [
+    # parenthesis are grouped first, the case can't be closed
+    ('case ( end )', ['case', ' ', 'Parenthesis']),
+    # an unclosed parenthesis doesn't separate anything
+    ('case ( end', ['Case']),
+    ('a[ ( ] )', ['a', 'SquareBrackets', ' ', ')']),
+    ('x ( case a[ ) end ]', ['x', ' ', '(', ' ', 'case', ' ', 'a',
+                             'SquareBrackets']),
+    # a token closing two groups closes both
+    ('case begin end end', ['Case', ' ', 'end']),
+])
+def test_grouping_matching_unbalanced(s, expected):
+    stmt = _ungrouped(s)
+    grouping.group_matching(stmt)
+    assert [type(token).__name__ if token.is_group else token.value
+            for token in stmt.tokens] == expected
+
+
+def test_grouping_matching_grouped():
+    stmt = _ungrouped('select case when (a[1]) then 1 end')
+    grouping.group_case(stmt)
+    grouping.group_matching(stmt)
+    case = stmt.tokens[-1]
+    assert isinstance(case, sql.Case)
+    assert isinstance(case.tokens[4], sql.Parenthesis)
+    assert isinstance(case.tokens[4].tokens[2], sql.SquareBrackets)
@@ -2,11 +2,15 @@
 
 """Tests sqlparse.parse()."""
 
+import pickle
+
 import pytest
 
 import sqlparse
 from sqlparse import sql, tokens as T
 from sqlparse.compat import StringIO
+from sqlparse.engine import grouping
+from sqlparse.exceptions import SQLParseError
 
 
 def test_parse_tokenize():
@@ -384,3 +388,156 @@ def test_stmt_tokens_parents():
     stmt = sqlparse.parse(s)[0]
     for token in stmt.tokens:
         assert token.has_ancestor(stmt)
+
+
+def test_tokenlist_value_is_updated():
+    p = sqlparse.parse('select foo, bar from baz')[0]
+    idlist = p.tokens[2]
+    assert idlist.value == 'foo, bar'
+    assert idlist.normalized == 'foo, bar'
+    idlist.insert_after(idlist.tokens[-1], sql.Token(T.Name, 'x'))
+    assert idlist.value == 'foo, barx'
+    assert p.value == 'select foo, barx from baz'
+
+
+def test_tokenlist_value_extended_group():
+    p = sqlparse.parse('select ' + ', '.join(str(i) for i in range(50)))[0]
+    idlist = p.tokens[2]
+    assert isinstance(idlist, sql.IdentifierList)
+    assert idlist.value == str(idlist) == p.value[len('select '):]
+
+
+def test_grouped_tokens_have_no_dict():
+    p = sqlparse.parse('select a, (b) from c where d = 1')[0]
+    groups = [p]
+    while groups:
+        token = groups.pop()
+        assert not hasattr(token, '__dict__')
+        groups.extend(t for t in token.tokens if t.is_group)
+    for cls in vars(sql).values():
+        if isinstance(cls, type) and issubclass(cls, sql.TokenList):
+            assert '__slots__' in vars(cls), cls
+
+
+def test_grouped_tokens_pickle():
+    p = sqlparse.parse('select a, b from c where d = 1')[0]
+    p2 = pickle.loads(pickle.dumps(p, 2))
+    assert str(p2) == str(p)
+    assert isinstance(p2.tokens[2], sql.IdentifierList)
+    assert p2.tokens[2].parent is p2
+    assert p2.tokens[2].normalized == 'a, b'
+
+
+def test_lazy_tokens_pickle():
+    s = 'select (select (x) y from t) z from u where a = 1'
+    p = sqlparse.parse(s, lazy=True)[0]
+    p2 = pickle.loads(pickle.dumps(p, 2))
+    assert str(p2) == s
+    assert isinstance(p2.tokens[-1], sql.Where)
+    assert isinstance(p2.tokens[2].tokens[0].tokens[3], sql.Identifier)
+
+
+def test_parse_grouping_profiles():
+    s = 'select a.b, f(c) from t where (x = 1)'
+    stmt = sqlparse.parse(s, grouping='none')[0]
+    assert not any(token.is_group for token in stmt.tokens)
+    assert str(stmt) == s
+
+    stmt = sqlparse.parse(s, grouping='parenthesis')[0]
+    assert [type(token) for token in stmt.tokens if token.is_group] == [
+        sql.Parenthesis, sql.Parenthesis]
+
+    stmt = sqlparse.parse(s, grouping='identifiers')[0]
+    assert [type(token) for token in stmt.tokens if token.is_group] == [
+        sql.Identifier, sql.Function, sql.Identifier, sql.Parenthesis]
+
+    stmt = sqlparse.parse(s, grouping='full')[0]
+    assert isinstance(stmt.tokens[-1], sql.Where)
+
+
+def test_parse_grouping_passes():
+    stmt = sqlparse.parse('select (a.b)', grouping={
+        grouping.group_parenthesis, grouping.group_period})[0]
+    assert isinstance(stmt.tokens[-1], sql.Parenthesis)
+    assert isinstance(stmt.tokens[-1].tokens[1], sql.Identifier)
+
+
+def test_parse_grouping_formatting_filters():
+    # filters that rely on grouping still get all groups
+    stmt = sqlparse.parse('select a from b where c', grouping='none',
+                          reindent=True)[0]
+    assert isinstance(stmt.tokens[-1], sql.Where)
+
+
+@pytest.mark.parametrize('value', ['foo', 42, [len]])
+def test_parse_grouping_invalid(value):
+    with pytest.raises(SQLParseError):
+        sqlparse.parse('select 1', grouping=value)
+
+
+def test_token_next_prev_skipping():
+    p = sqlparse.parse('select  /* c */ a ,\n b')[0]
+    for _ in range(2):  # the second round uses the navigation index
+        assert p.token_first().value == 'select'
+        assert p.token_next(0) == (2, p.tokens[2])
+        assert p.token_next(0, skip_cm=True) == (4, p.tokens[4])
+        assert p.token_next(0, skip_ws=False) == (1, p.tokens[1])
+        assert p.token_prev(4) == (2, p.tokens[2])
+        assert p.token_prev(4, skip_cm=True) == (0, p.tokens[0])
+        assert p.token_prev(0) == (None, None)
+        assert p.token_next(4) == (None, None)
+
+    # the index is rebuilt when the tokens change, groups are never skipped
+    p.insert_before(1, sql.Token(T.Keyword, 'distinct'))
+    assert p.token_next(0)[1].value == 'distinct'
+    p.tokens.pop(1)
+    assert p.token_next(0)[1].value == '/* c */'
+    p.group_tokens(sql.Identifier, 2, 2)
+    assert p.token_next(0, skip_cm=True)[1].value == '/* c */'
+
+
+def test_token_next_prev_replaced():
+    # tokens replaced without changing the length of the list
+    p = sqlparse.parse('select  /* c */ a ,\n b')[0]
+    for _ in range(2):
+        assert p.token_next(0) == (2, p.tokens[2])
+    p.tokens[2] = sql.Token(T.Whitespace, ' ')
+    assert p.token_next(0) == (4, p.tokens[4])
+    assert p.token_prev(4) == (0, p.tokens[0])
+    for _ in range(2):
+        assert p.token_prev(4) == (0, p.tokens[0])
+    p.tokens.insert(1, p.tokens.pop(4))
+    assert p.token_next(0) == (1, p.tokens[1])
+    assert p.token_prev(4) == (1, p.tokens[1])
+
+
+def test_token_next_prev_inserted():
+    p = sqlparse.parse('select  /* c */ a')[0]
+    for _ in range(2):
+        assert p.token_next(0, skip_cm=True) == (4, p.tokens[4])
+    p.insert_before(2, sql.Token(T.Name, 'x'))
+    p.tokens.pop(3)
+    assert p.token_next(0, skip_cm=True) == (2, p.tokens[2])
+    assert p.token_prev(4, skip_cm=True) == (2, p.tokens[2])
+
+
+def test_token_index():
+    p = sqlparse.parse('select a, b from c')[0]
+    tokens = list(p.tokens)
+    for _ in range(2):  # the second round uses the position index
+        for idx, token in enumerate(tokens):
+            assert p.token_index(token) == idx
+            assert p.token_index(token, idx) == idx
+        assert p.token_index(tokens[4], tokens[2]) == 4
+        with pytest.raises(ValueError):
+            p.token_index(tokens[2], 3)
+        with pytest.raises(ValueError):
+            p.token_index(sql.Token(T.Whitespace, ' '))
+
+    # replaced tokens aren't found at their old position
+    p.tokens[2] = sql.Token(T.Name, 'x')
+    with pytest.raises(ValueError):
+        p.token_index(tokens[2])
+    assert p.token_index(p.tokens[2]) == 2
+    p.insert_after(tokens[0], sql.Token(T.Whitespace, ' '))
+    assert p.token_index(tokens[4]) == 5
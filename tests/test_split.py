@@ -2,12 +2,15 @@
 
 # Tests splitting functions.
 
+import threading
 import types
 
 import pytest
 
 import sqlparse
+from sqlparse import lexer
 from sqlparse.compat import StringIO, text_type
+from sqlparse.engine import StatementSplitter, parallel
 
 
 def test_split_semicolon():
@@ -138,3 +141,108 @@ def test_split_simple():
     assert len(stmts) == 2
     assert stmts[0] == 'select * from foo;'
     assert stmts[1] == 'select * from bar;'
+
+
+@pytest.mark.parametrize('fn', ['begintag.sql', 'dashcomment.sql',
+                                'function_psql.sql', 'huge_select.sql'])
+def test_split_file(load_file, filepath, fn):
+    stmts = sqlparse.split_file(filepath(fn))
+    assert isinstance(stmts, types.GeneratorType)
+    assert list(stmts) == sqlparse.split(load_file(fn))
+
+
+def test_split_file_encoding(load_file, filepath):
+    stmts = list(sqlparse.split_file(filepath('test_cp1251.sql'), 'cp1251'))
+    assert stmts == sqlparse.split(load_file('test_cp1251.sql', 'cp1251'))
+
+
+def test_split_file_empty(tmpdir):
+    path = tmpdir.join('empty.sql')
+    path.write('')
+    assert list(sqlparse.split_file(str(path))) == []
+
+
+def test_parsestream_file(load_file, filepath):
+    stmts = list(sqlparse.parsestream_file(filepath('begintag.sql')))
+    assert len(stmts) == 3
+    assert ''.join(text_type(q) for q in stmts) == load_file('begintag.sql')
+
+
+@pytest.mark.parametrize('fn', ['begintag.sql', 'begintag_2.sql',
+                                'dashcomment.sql', 'function_psql.sql',
+                                'function_psql3.sql', 'huge_select.sql'])
+def test_split_offsets(load_file, fn):
+    sql = load_file(fn)
+    offsets = StatementSplitter().process_offsets(lexer.tokenize(sql))
+    stmts = StatementSplitter().process(lexer.tokenize(sql))
+    assert [sql[start:end] for start, end in offsets] == [
+        text_type(stmt) for stmt in stmts]
+
+
+def test_split_parallel(tmpdir):
+    sql = ("select 'a;\nb';\n"
+           "create function f() returns int as $$\nbegin\n  x := 1;\n"
+           "select 2;\nend;\n$$ language plpgsql;\n"
+           "/* c;\nselect */ select 3;\n"
+           "CREATE PROCEDURE p BEGIN\n select 1;\nselect 2;\nEND;\n"
+           "-- c;\nselect 4;\n") * 20
+    path = tmpdir.join('dump.sql')
+    path.write(sql)
+    stmts = parallel.split_parallel(str(path), processes=2, range_size=50)
+    assert list(stmts) == sqlparse.split(sql)
+
+
+def test_split_parallel_long_body(tmpdir):
+    body = ''.join('select {0};\nx := {0};\n'.format(i) for i in range(50))
+    sql = ("select 1;\ncreate function f() returns int as $$\n"
+           + body + "$$ language sql;\nselect 2;\nselect 3;\n") * 3
+    path = tmpdir.join('dump.sql')
+    path.write(sql)
+    stmts = parallel.split_parallel(str(path), processes=2, range_size=20)
+    assert list(stmts) == sqlparse.split(sql)
+
+    # the worker moves an end inside the body to a later boundary
+    start = sql.index('create')
+    end, stmts = parallel.split_range((str(path), start, start + 60, None))
+    assert stmts == sqlparse.split(sql[start:end])
+    assert stmts[0].endswith('$$ language sql;')
+
+
+@pytest.mark.parametrize('start, end', [
+    ("select 'a;\n", "';\n"),
+    ('/* c;\n', '*/ select 2;\n'),
+    ('CREATE PROCEDURE p BEGIN\n', 'END;\n')])
+def test_split_parallel_skipped_ranges(tmpdir, start, end):
+    # the first range is extended over many following ranges
+    sql = start + 'select 1;\n' * 80 + end + 'select 3;\n' * 10
+    path = tmpdir.join('dump.sql')
+    path.write(sql)
+
+    def run():
+        for _ in range(10):
+            stmts = parallel.split_parallel(str(path), processes=2,
+                                            range_size=30)
+            results.append(list(stmts))
+        first = parallel.split_parallel(str(path), processes=2,
+                                        range_size=30)
+        next(first)
+        first.close()
+        results.append(None)
+
+    results = []
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive()
+    assert results == [sqlparse.split(sql)] * 10 + [None]
+
+
+def test_split_parallel_find_cuts():
+    buf = b'select 1;\nselect 2;\n  select 3; \nselect 4'
+    assert parallel.find_cuts(buf, len(buf), 1) == [0, 9, 33, len(buf)]
+
+
+def test_split_parallel_single_range(load_file, filepath):
+    stmts = sqlparse.split_parallel(filepath('begintag.sql'))
+    assert list(stmts) == sqlparse.split(load_file('begintag.sql'))
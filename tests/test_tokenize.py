@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import io
 import types
+from multiprocessing.pool import ThreadPool
 
 import pytest
 
 import sqlparse
 from sqlparse import lexer
 from sqlparse import sql, tokens as T
+from sqlparse.keywords import SQL_REGEX
 from sqlparse.compat import StringIO
+from sqlparse.utils import Matcher
 
 
 def test_tokenize_simple():
@@ -81,6 +85,45 @@ def test_token_repr():
     assert repr(token)[:len(tst)] == tst
 
 
+def test_tokentype_contains():
+    assert T.Keyword.DML in T.Keyword
+    assert T.Keyword in T.Keyword
+    assert T.Keyword.DML in T.Token
+    assert T.Keyword not in T.Keyword.DML
+    assert T.Name not in T.Keyword
+    assert T.String in T.Literal
+    assert T.Token.Foo.Bar in T.Token.Foo
+    assert None not in T.Keyword
+    assert ('Keyword', 'DML') in T.Keyword
+    assert ('Name',) not in T.Keyword
+
+
+def _tokentypes(ttype=T.Token):
+    yield ttype
+    for value in list(vars(ttype).values()):
+        if isinstance(value, T._TokenType) and value.parent is ttype:
+            for subtype in _tokentypes(value):
+                yield subtype
+
+
+def test_tokentype_tree_complete(load_file):
+    # All types are created on import, parsing doesn't change the tree
+    types = set(_tokentypes())
+    for filename in ('function_psql.sql', 'begintag.sql', 'test_cp1251.sql'):
+        sqlparse.parse(load_file(filename, 'cp1251'))
+    assert set(_tokentypes()) == types
+
+
+def test_tokentype_threads():
+    pool = ThreadPool(8)
+    try:
+        types = pool.map(lambda _: T.Token.Threads.Foo.Bar, range(32))
+    finally:
+        pool.close()
+    assert all(ttype is types[0] for ttype in types)
+    assert types[0] in T.Token.Threads
+
+
 def test_token_flatten():
     token = sql.Token(T.Keyword, 'foo')
     gen = token.flatten()
@@ -112,6 +155,39 @@ def test_tokenlist_token_matching():
     assert x.token_matching([lambda t: t.ttype is T.Keyword], 1) is None
 
 
+def test_token_match_regex():
+    kw = sql.Token(T.Keyword, 'inner join')
+    name = sql.Token(T.Name, 'Foo')
+    for _ in range(2):  # the second round uses the cached patterns
+        assert kw.match(T.Keyword, ['FROM', 'JOIN$'], regex=True)
+        assert kw.match(T.Keyword, r'inner\s+', regex=True)
+        assert not kw.match(T.Keyword, '^JOIN', regex=True)
+        # the values of other tokens are case-sensitive
+        assert name.match(T.Name, ('^F',), regex=True)
+        assert not name.match(T.Name, ('^f',), regex=True)
+
+
+def test_matcher():
+    kw = sql.Token(T.Keyword.DML, 'select')
+    name = sql.Token(T.Name, 'foo')
+    ident = sql.Identifier([name])
+
+    # a single token type matches subtypes, a tuple only its members
+    assert Matcher(t=T.Keyword)(kw)
+    assert not Matcher(t=(T.Keyword, T.Name))(kw)
+    assert Matcher(t=[T.Keyword, T.Name])(kw)
+    assert Matcher(m=(T.Keyword, ('SELECT', 'insert')))(kw)
+    assert Matcher(m=(T.Keyword, 'SEL', True))(kw)
+    assert not Matcher(m=(T.Name, 'FOO'))(name)
+    assert Matcher(m=[(T.Keyword, 'from'), (T.Name, None)])(name)
+    assert Matcher(i=sql.Identifier)(ident)
+    assert not Matcher(i=sql.Identifier, t=T.Keyword)(name)
+    assert not Matcher(t=T.Token)(None)
+
+    x = sql.TokenList([kw, name])
+    assert x.token_next_by(m=Matcher(t=T.Name)) == (1, name)
+
+
 def test_stream_simple():
     stream = StringIO("SELECT 1; SELECT 2;")
 
@@ -157,3 +233,97 @@ def test_parse_endifloop(s):
     p = sqlparse.parse(s)[0]
     assert len(p.tokens) == 1
     assert p.tokens[0].ttype is T.Keyword
+
+
+@pytest.mark.parametrize('filename, encoding', [
+    ('_Make_DirEntry.sql', 'utf-8'),
+    ('begintag.sql', 'utf-8'),
+    ('begintag_2.sql', 'utf-8'),
+    ('dashcomment.sql', 'utf-8'),
+    ('function.sql', 'utf-8'),
+    ('function_psql.sql', 'utf-8'),
+    ('function_psql2.sql', 'utf-8'),
+    ('function_psql3.sql', 'utf-8'),
+    ('huge_select.sql', 'utf-8'),
+    ('test_cp1251.sql', 'cp1251')])
+def test_tokenize_combined_lexer(load_file, filename, encoding):
+    sql = load_file(filename, encoding)
+    expected = list(lexer.tokenize(sql))
+    assert list(lexer.tokenize(sql, lexer=lexer.CombinedLexer)) == expected
+
+
+@pytest.mark.parametrize('s', ['FOOBAR{', "select 'unclosed", 'a.b.c',
+                               'x::int', 'foo ( bar', '[foo] x[1]'])
+def test_tokenize_combined_lexer_misc(s):
+    expected = list(lexer.tokenize(s))
+    assert list(lexer.tokenize(s, lexer=lexer.CombinedLexer)) == expected
+
+
+def test_tokenize_dispatch_table():
+    # rules left out for a character must not match text starting with it
+    tails = ['', 'a', '1', ' ', '.x', '(', "'", '"', '`', '$', '*/', '\n',
+             'oin', 'nd if', 'x1 ', '+']
+    for char, rules in lexer.SQL_DISPATCH.items():
+        skipped = [rx for rx in SQL_REGEX if rx not in rules]
+        for rexmatch, _ in skipped:
+            for tail in tails:
+                assert rexmatch(char + tail) is None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 4096])
+@pytest.mark.parametrize('filename', ['begintag.sql', 'dashcomment.sql',
+                                      'function_psql.sql', 'huge_select.sql'])
+def test_tokenize_stream_files(load_file, filename, chunk_size):
+    sql = load_file(filename)
+    stream = lexer.tokenize_stream(StringIO(sql), chunk_size=chunk_size)
+    assert list(stream) == list(lexer.tokenize(sql))
+
+
+@pytest.mark.parametrize('s', [
+    "select 'it''s', 'a\\'b' from x",
+    'select `foo``bar`, "foo\nbar", "x\n"',
+    'select /* multi\nline */ 1 -- single\r\n; 2',
+    'left outer join x on a.b = foo (1.5E-3)',
+    'create or replace function $body$ begin end $body$',
+    'select x[1], [foo bar] from y',
+    "select 'unclosed",
+    'select /* unclosed',
+    'select %(name)s from x where y = %(y_1)s',
+    'select 5 %(a) %('])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5])
+def test_tokenize_stream_chunk_boundaries(s, chunk_size):
+    stream = lexer.tokenize_stream(StringIO(s), chunk_size=chunk_size)
+    assert list(stream) == list(lexer.tokenize(s))
+
+
+@pytest.mark.parametrize('stream', [
+    lambda s: StringIO(s),
+    lambda s: io.BytesIO(s.encode('utf-8'))])
+def test_tokenize_stream_lexer(stream):
+    s = u'select "äöü" from foo; -- c'
+    expected = list(lexer.tokenize(s))
+    for lexer_ in (lexer.Lexer, lexer.CombinedLexer):
+        tokens = list(lexer.tokenize(stream(s), lexer=lexer_))
+        assert tokens == expected
+
+    class TextLexer(lexer.Lexer):
+        @staticmethod
+        def get_tokens(text, encoding=None):
+            return [(T.Text, text)]
+
+    assert list(lexer.tokenize(stream(s), lexer=TextLexer)) == [(T.Text, s)]
+
+
+def test_tokenize_stream_bytes_invalid():
+    sql = b'select \xff;'
+    expected = list(lexer.tokenize(u'select \ufffd;'))
+    assert list(lexer.tokenize(io.BytesIO(sql))) == expected
+    assert list(lexer.tokenize(io.BytesIO(sql),
+                               lexer=lexer.CombinedLexer)) == expected
+
+
+def test_tokenize_stream_bytes():
+    s = u'select * from foo where bar = \'äöü\';'
+    stream = io.BytesIO(s.encode('utf-8'))
+    tokens = list(lexer.tokenize_stream(stream, chunk_size=1))
+    assert tokens == list(lexer.tokenize(s))